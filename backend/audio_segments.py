@@ -0,0 +1,111 @@
+"""
+Audio segmentation and parallel transcription for long recordings.
+
+Recordings are split on silence (falling back to fixed windows), each segment
+is exported with pydub and transcribed concurrently, and the transcripts are
+stitched back together in order with their start/end offsets.
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from pydub import AudioSegment
+from pydub.silence import detect_nonsilent
+from pydub.utils import mediainfo
+
+from metrics import openai_call
+
+# Recordings longer than this are split before transcription
+SEGMENT_THRESHOLD_MS = int(os.getenv("SEGMENT_THRESHOLD_MS", str(5 * 60 * 1000)))
+SEGMENT_MAX_MS = int(os.getenv("SEGMENT_MAX_MS", str(2 * 60 * 1000)))
+SEGMENT_MIN_SILENCE_MS = int(os.getenv("SEGMENT_MIN_SILENCE_MS", "700"))
+# Silence threshold relative to the recording's average loudness
+SEGMENT_SILENCE_OFFSET_DB = float(os.getenv("SEGMENT_SILENCE_OFFSET_DB", "16"))
+TRANSCRIBE_CONCURRENCY = int(os.getenv("TRANSCRIBE_CONCURRENCY", "4"))
+
+def load_audio(path):
+    return AudioSegment.from_file(path)
+
+def audio_duration_ms(path):
+    """Duration from the container metadata (ffprobe), without decoding the audio"""
+    try:
+        return int(float(mediainfo(path).get("duration", 0)) * 1000)
+    except (ValueError, OSError):
+        return len(load_audio(path))
+
+def fixed_windows(duration_ms, window_ms=SEGMENT_MAX_MS, overlap_ms=0):
+    """(start_ms, end_ms) windows covering the whole recording"""
+    step = max(window_ms - overlap_ms, 1)
+    return [(start, min(start + window_ms, duration_ms)) for start in range(0, duration_ms, step)]
+
+def silence_windows(audio, max_ms=SEGMENT_MAX_MS, min_silence_ms=SEGMENT_MIN_SILENCE_MS,
+                    silence_offset_db=SEGMENT_SILENCE_OFFSET_DB):
+    """Windows cut at pauses, each at most max_ms long.
+
+    Speech ranges between pauses are merged greedily until the next one would
+    exceed max_ms; a single range longer than max_ms is cut into fixed windows.
+    """
+    speech = detect_nonsilent(
+        audio,
+        min_silence_len=min_silence_ms,
+        silence_thresh=audio.dBFS - silence_offset_db
+    )
+    if not speech:
+        return fixed_windows(len(audio), max_ms)
+
+    windows = []
+    start, end = speech[0]
+    for range_start, range_end in speech[1:]:
+        if range_end - start <= max_ms:
+            end = range_end
+        else:
+            windows.append((start, end))
+            start, end = range_start, range_end
+    windows.append((start, end))
+
+    result = []
+    for start, end in windows:
+        if end - start > max_ms:
+            result.extend((start + s, start + e) for s, e in fixed_windows(end - start, max_ms))
+        else:
+            result.append((start, end))
+    return result
+
+def export_segments(audio, windows, out_dir, stem, format="mp3", bitrate="64k"):
+    """Write each window to <out_dir>/<stem>.segNNN.<format>; returns the file names"""
+    os.makedirs(out_dir, exist_ok=True)
+    names = []
+    for i, (start, end) in enumerate(windows):
+        name = f"{stem}.seg{i:03d}.{format}"
+        audio[start:end].export(os.path.join(out_dir, name), format=format, bitrate=bitrate)
+        names.append(name)
+    return names
+
+def transcribe_file(path, client):
+    with open(path, "rb") as audio_file, openai_call("transcription"):
+        return client.audio.transcriptions.create(model="whisper-1", file=audio_file).text
+
+def transcribe_segments(paths, client, concurrency=TRANSCRIBE_CONCURRENCY):
+    """Transcribe segment files in parallel, preserving order"""
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        return list(pool.map(lambda path: transcribe_file(path, client), paths))
+
+def format_timestamp(ms):
+    seconds = ms // 1000
+    return f"{seconds // 3600:02d}:{seconds // 60 % 60:02d}:{seconds % 60:02d}"
+
+def stitch_transcripts(segments, timestamps=False):
+    """Join segment dicts ({start_ms, end_ms, text}) into one transcript"""
+    if timestamps:
+        return "\n".join(f"[{format_timestamp(s['start_ms'])}] {s['text'].strip()}" for s in segments)
+    return " ".join(s["text"].strip() for s in segments if s["text"].strip())
+
+def segment_and_transcribe(path, client, out_dir, stem, concurrency=TRANSCRIBE_CONCURRENCY):
+    """Split a long recording, transcribe the pieces in parallel and return
+    segment dicts with start_ms, end_ms, text and audio_path (file name in out_dir)"""
+    audio = load_audio(path)
+    windows = silence_windows(audio)
+    names = export_segments(audio, windows, out_dir, stem)
+    texts = transcribe_segments([os.path.join(out_dir, name) for name in names], client, concurrency)
+    return [
+        {"start_ms": start, "end_ms": end, "text": text, "audio_path": name}
+        for (start, end), text, name in zip(windows, texts, names)
+    ]
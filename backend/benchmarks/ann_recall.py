@@ -0,0 +1,97 @@
+"""
+Recall vs latency benchmark: ANN index vs exact search on story embeddings.
+
+Builds a throwaway `bench_stories` table per corpus size, indexes it the same
+way `database.create_vector_index` indexes `stories`, and compares top-k
+results against an exact (sequential scan) search.
+
+Usage (from backend/):
+  python -m benchmarks.ann_recall                  # 10k, 100k and 1M stories
+  python -m benchmarks.ann_recall 10000 100000     # custom corpus sizes
+  VECTOR_INDEX_TYPE=ivfflat python -m benchmarks.ann_recall
+"""
+import sys
+import numpy as np
+from sqlalchemy import text
+
+from database import engine, create_vector_index, VECTOR_INDEX_TYPE
+from benchmarks.common import synthetic_embeddings, vector_literal, copy_rows, percentile, timed
+
+TABLE = "bench_stories"
+TOP_K = 5
+N_QUERIES = 50
+LOAD_BATCH = 10_000
+SWEEP = {
+    "hnsw": ("hnsw.ef_search", [10, 20, 40, 80, 160]),
+    "ivfflat": ("ivfflat.probes", [1, 5, 10, 20, 50]),
+}
+
+def build_corpus(n, rng):
+    with engine.connect() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        conn.execute(text(f"CREATE TABLE {TABLE} (id serial PRIMARY KEY, embedding vector(1536))"))
+        conn.commit()
+    
+    for start in range(0, n, LOAD_BATCH):
+        batch = synthetic_embeddings(min(LOAD_BATCH, n - start), rng)
+        copy_rows(engine, TABLE, ["embedding"], ((vector_literal(v),) for v in batch))
+    
+    with engine.connect() as conn:
+        # The table is plain vector(1536) whatever EMBEDDING_STORAGE is; benchmarks/embedding_storage covers the others
+        _, build_ms = timed(create_vector_index, conn, table=TABLE, storage="full")
+        conn.execute(text(f"ANALYZE {TABLE}"))
+        conn.commit()
+    return build_ms
+
+def search(conn, query, setting=None, value=None, exact=False):
+    with conn.begin():
+        if exact:
+            conn.execute(text("SET LOCAL enable_indexscan = off"))
+        elif setting:
+            conn.execute(text(f"SET LOCAL {setting} = {value}"))
+        rows = conn.execute(
+            text(f"SELECT id FROM {TABLE} ORDER BY embedding <=> :q LIMIT {TOP_K}"),
+            {"q": query},
+        ).fetchall()
+    return [r[0] for r in rows]
+
+def run(n):
+    rng = np.random.default_rng(42)
+    print(f"\n=== {n:,} stories ({VECTOR_INDEX_TYPE}) ===")
+    build_ms = build_corpus(n, rng)
+    print(f"index build: {build_ms / 1000:.1f}s")
+    
+    queries = [vector_literal(v) for v in synthetic_embeddings(N_QUERIES, rng)]
+    with engine.connect() as conn:
+        truth, exact_ms = [], []
+        for q in queries:
+            ids, ms = timed(search, conn, q, exact=True)
+            truth.append(set(ids))
+            exact_ms.append(ms)
+        print(f"{'exact':>22}  recall@{TOP_K}=1.000  p50={percentile(exact_ms, 50):7.2f}ms  p95={percentile(exact_ms, 95):7.2f}ms")
+        
+        if VECTOR_INDEX_TYPE not in SWEEP:
+            return
+        setting, values = SWEEP[VECTOR_INDEX_TYPE]
+        for value in values:
+            recalls, latencies = [], []
+            for q, expected in zip(queries, truth):
+                ids, ms = timed(search, conn, q, setting, value)
+                recalls.append(len(expected & set(ids)) / TOP_K)
+                latencies.append(ms)
+            label = f"{setting}={value}"
+            print(f"{label:>22}  recall@{TOP_K}={np.mean(recalls):.3f}  p50={percentile(latencies, 50):7.2f}ms  p95={percentile(latencies, 95):7.2f}ms")
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10_000, 100_000, 1_000_000]
+    try:
+        for n in sizes:
+            run(n)
+    finally:
+        with engine.connect() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+            conn.commit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Retrieval quality and latency: whole-story vectors vs chunk max-sim.
+
+Creates a throwaway profile whose synthetic stories each cover several
+topics (one chunk per topic). The whole-story vector is the mean of its
+chunks, which models how one embedding of a long transcript dilutes each
+passage. Queries target a single passage; the story containing it is the
+right answer. Both modes run through retrieval.search_stories against the real
+tables and indexes (full-text fusion off: the corpus has no real text).
+
+Usage (from backend/):
+  python -m benchmarks.chunk_retrieval                # 2,000 stories x 8 chunks
+  python -m benchmarks.chunk_retrieval 10000 12       # stories, chunks per story
+"""
+import sys
+import numpy as np
+from sqlalchemy import text
+
+from database import engine, SessionLocal, Profile, create_profile_vector_indexes, drop_profile_vector_index, VECTOR_TABLES
+from retrieval import search_stories
+from benchmarks.common import synthetic_embeddings, vector_literal, copy_rows, percentile, timed
+
+N_QUERIES = 200
+TOP_K = 5
+
+def build_corpus(profile_id, n_stories, chunks_per_story, rng):
+    chunk_vectors = synthetic_embeddings(n_stories * chunks_per_story, rng).reshape(n_stories, chunks_per_story, -1)
+    story_vectors = chunk_vectors.mean(axis=1)
+    story_vectors /= np.linalg.norm(story_vectors, axis=1, keepdims=True)
+    
+    copy_rows(engine, "stories", ["profile_id", "transcript", "embedding", "status"], (
+        (profile_id, f"Synthetic story {i}", vector_literal(v), "ready") for i, v in enumerate(story_vectors)
+    ))
+    with engine.connect() as conn:
+        story_ids = [r[0] for r in conn.execute(
+            text("SELECT id FROM stories WHERE profile_id = :p ORDER BY id"), {"p": profile_id}
+        )]
+    copy_rows(engine, "story_chunks", ["story_id", "profile_id", "chunk_index", "text", "embedding"], (
+        (story_id, profile_id, j, f"Synthetic chunk {j}", vector_literal(chunk_vectors[i, j]))
+        for i, story_id in enumerate(story_ids)
+        for j in range(chunks_per_story)
+    ))
+    create_profile_vector_indexes(profile_id)
+    with engine.connect() as conn:
+        for table in VECTOR_TABLES:
+            conn.execute(text(f"ANALYZE {table}"))
+        conn.commit()
+    return story_ids, chunk_vectors
+
+def main():
+    args = [int(a) for a in sys.argv[1:]]
+    n_stories = args[0] if args else 2000
+    chunks_per_story = args[1] if len(args) > 1 else 8
+    rng = np.random.default_rng(11)
+    
+    db = SessionLocal()
+    profile = Profile(name="Benchmark", relation="benchmark")
+    db.add(profile)
+    db.commit()
+    profile_id = profile.id
+    try:
+        print(f"{n_stories:,} stories x {chunks_per_story} chunks")
+        story_ids, chunk_vectors = build_corpus(profile_id, n_stories, chunks_per_story, rng)
+        
+        targets = rng.integers(0, n_stories, N_QUERIES)
+        passages = rng.integers(0, chunks_per_story, N_QUERIES)
+        queries = chunk_vectors[targets, passages] + 0.02 * rng.standard_normal((N_QUERIES, chunk_vectors.shape[2]))
+        
+        for mode in ("stories", "chunks"):
+            hits, reciprocal_ranks, latencies = [], [], []
+            for query, target in zip(queries, targets):
+                results, ms = timed(search_stories, db, profile_id, query.tolist(), mode=mode, limit=TOP_K, hybrid=False)
+                db.rollback()
+                ids = [story.id for story in results]
+                expected = story_ids[target]
+                hits.append(expected in ids)
+                reciprocal_ranks.append(1 / (ids.index(expected) + 1) if expected in ids else 0.0)
+                latencies.append(ms)
+            print(
+                f"{mode:>8}: hit@{TOP_K}={np.mean(hits):.3f}  MRR={np.mean(reciprocal_ranks):.3f}  "
+                f"p50={percentile(latencies, 50):6.2f}ms  p95={percentile(latencies, 95):6.2f}ms"
+            )
+    finally:
+        db.rollback()
+        db.execute(text("DELETE FROM story_chunks WHERE profile_id = :p"), {"p": profile_id})
+        db.execute(text("DELETE FROM stories WHERE profile_id = :p"), {"p": profile_id})
+        db.execute(text("DELETE FROM profiles WHERE id = :p"), {"p": profile_id})
+        db.commit()
+        db.close()
+        for table in VECTOR_TABLES:
+            drop_profile_vector_index(profile_id, table)
+
+if __name__ == "__main__":
+    main()
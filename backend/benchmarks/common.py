@@ -0,0 +1,45 @@
+"""
+Shared helpers for the benchmark scripts
+"""
+import io
+import time
+import numpy as np
+
+EMBEDDING_DIM = 1536
+
+N_CLUSTERS = 256
+
+# Fixed topic centers so every batch (and every query) shares the same clusters
+_CENTERS = np.random.default_rng(0).standard_normal((N_CLUSTERS, EMBEDDING_DIM)).astype(np.float32)
+
+def synthetic_embeddings(n, rng, noise=0.35):
+    """Clustered unit vectors; closer to real embeddings than uniform noise"""
+    vectors = _CENTERS[rng.integers(0, N_CLUSTERS, n)]
+    vectors += noise * rng.standard_normal((n, EMBEDDING_DIM)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors
+
+def vector_literal(vector):
+    return "[" + ",".join(f"{x:.6f}" for x in vector) + "]"
+
+def copy_rows(engine, table, columns, rows):
+    """Bulk load rows (tuples of already-formatted values) with COPY"""
+    buf = io.StringIO()
+    for row in rows:
+        buf.write("\t".join("\\N" if v is None else str(v) for v in row) + "\n")
+    buf.seek(0)
+    raw = engine.raw_connection()
+    try:
+        with raw.cursor() as cur:
+            cur.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN", buf)
+        raw.commit()
+    finally:
+        raw.close()
+
+def percentile(values, p):
+    return float(np.percentile(values, p)) if len(values) else 0.0
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
@@ -0,0 +1,97 @@
+"""
+Disk, memory, latency and recall of each EMBEDDING_STORAGE mode.
+
+Loads the same synthetic corpus into one throwaway table per mode (full
+vector, halfvec, binary-quantized index), indexes it the way
+`database.create_vector_index` would, and runs the /chat candidate query
+from `retrieval.nearest_sql` against it. Recall is measured against exact
+float32 top-k computed in NumPy. The HNSW index has to stay in RAM to be
+fast, so its size is the memory footprint that matters.
+
+Usage (from backend/):
+  python -m benchmarks.embedding_storage             # 100k stories
+  python -m benchmarks.embedding_storage 1000000
+"""
+import sys
+import numpy as np
+from sqlalchemy import text
+
+from database import engine, create_vector_index, embedding_sql_type, HNSW_EF_SEARCH
+from retrieval import nearest_sql
+from benchmarks.common import synthetic_embeddings, vector_literal, copy_rows, percentile, timed
+
+TOP_K = 10
+N_QUERIES = 50
+LOAD_BATCH = 10_000
+RERANK_FACTORS = [1, 2, 4, 8]
+
+def table_name(storage):
+    return f"bench_storage_{storage}"
+
+def build(storage, corpus):
+    table = table_name(storage)
+    with engine.connect() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+        conn.execute(text(f"CREATE TABLE {table} (id integer PRIMARY KEY, embedding {embedding_sql_type(storage)})"))
+        conn.commit()
+    for start in range(0, len(corpus), LOAD_BATCH):
+        batch = corpus[start:start + LOAD_BATCH]
+        copy_rows(engine, table, ["id", "embedding"], ((start + i, vector_literal(v)) for i, v in enumerate(batch)))
+    with engine.connect() as conn:
+        _, build_ms = timed(create_vector_index, conn, table=table, index_type="hnsw", storage=storage)
+        conn.execute(text(f"ANALYZE {table}"))
+        conn.commit()
+        table_bytes = conn.execute(text(f"SELECT pg_table_size('{table}')")).scalar()
+        index_bytes = conn.execute(text(f"SELECT pg_relation_size('ix_{table}_embedding_hnsw')")).scalar()
+    return build_ms, table_bytes, index_bytes
+
+def search(conn, storage, query, shortlist):
+    sql = text(nearest_sql("id", table_name(storage), "TRUE", storage=storage))
+    with conn.begin():
+        conn.execute(text(f"SET LOCAL hnsw.ef_search = {max(HNSW_EF_SEARCH, shortlist)}"))
+        rows = conn.execute(sql, {"query_embedding": query, "candidates": TOP_K, "shortlist": shortlist}).fetchall()
+    return [r[0] for r in rows]
+
+def measure(storage, queries, truth, shortlist):
+    recalls, latencies = [], []
+    with engine.connect() as conn:
+        search(conn, storage, queries[0], shortlist)  # warm up
+        for q, expected in zip(queries, truth):
+            ids, ms = timed(search, conn, storage, q, shortlist)
+            recalls.append(len(expected & set(ids)) / TOP_K)
+            latencies.append(ms)
+    return np.mean(recalls), percentile(latencies, 50), percentile(latencies, 95)
+
+def run(n):
+    rng = np.random.default_rng(42)
+    corpus = synthetic_embeddings(n, rng)
+    query_vectors = synthetic_embeddings(N_QUERIES, rng)
+    # Exact float32 top-k; vectors are unit length, so cosine similarity is a dot product
+    truth = [set(np.argsort(-corpus @ q)[:TOP_K].tolist()) for q in query_vectors]
+    queries = [vector_literal(q) for q in query_vectors]
+
+    print(f"\n=== {n:,} stories, recall@{TOP_K} vs exact float32 ===")
+    print(f"{'storage':>16}  {'table':>9}  {'index':>9}  {'build':>7}  {'recall':>6}  {'p50':>8}  {'p95':>8}")
+    for storage in ("full", "halfvec", "binary"):
+        build_ms, table_bytes, index_bytes = build(storage, corpus)
+        factors = RERANK_FACTORS if storage == "binary" else [1]
+        for factor in factors:
+            recall, p50, p95 = measure(storage, queries, truth, TOP_K * factor)
+            label = f"{storage} x{factor}" if storage == "binary" else storage
+            print(f"{label:>16}  {table_bytes / 2**20:7.1f}MB  {index_bytes / 2**20:7.1f}MB  "
+                  f"{build_ms / 1000:6.1f}s  {recall:6.3f}  {p50:6.2f}ms  {p95:6.2f}ms")
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [100_000]
+    try:
+        for n in sizes:
+            run(n)
+    finally:
+        with engine.connect() as conn:
+            for storage in ("full", "halfvec", "binary"):
+                conn.execute(text(f"DROP TABLE IF EXISTS {table_name(storage)}"))
+            conn.commit()
+
+if __name__ == "__main__":
+    main()
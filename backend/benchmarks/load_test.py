@@ -0,0 +1,215 @@
+"""
+Concurrent load test for a running API.
+
+Fires a fixed number of requests at increasing concurrency levels and reports
+throughput and p50/p95/p99 latency per request kind. On a non-blocking
+request path, throughput should grow with the number of in-flight requests
+until OpenAI or Postgres saturate. Run the API against benchmarks.mock_openai
+to take OpenAI's latency and cost out of the numbers.
+
+Scenarios:
+  chat              POST /chat
+  chat_stream       POST /chat/stream, read to the end (also records time to first byte)
+  stories           POST /stories
+  timeline          GET /profiles/{id}/stories?limit=100
+  timeline_summary  GET /profiles/{id}/stories?limit=100&fields=summary
+  mixed             weighted mix: timeline 5, chat 3, timeline_summary 1, stories 1
+
+Usage (from backend/, with the API running):
+  python -m benchmarks.load_test                                  # chat, profile 1
+  API_URL=http://localhost:8000 PROFILE_ID=2 python -m benchmarks.load_test 1 4 16 64
+  python -m benchmarks.load_test --scenario mixed --output results.json 1 8 32
+  python -m benchmarks.load_test --scenario mixed --baseline results.json 1 8 32
+
+--baseline compares p95 and throughput per level and kind with an earlier
+--output file and exits non-zero when any is worse by more than
+REGRESSION_TOLERANCE (default 0.2, i.e. 20%). --unique-queries appends the
+request number to each chat question so the response cache never hits.
+"""
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+import httpx
+
+from benchmarks.common import percentile
+
+API_URL = os.getenv("API_URL", "http://localhost:8000")
+PROFILE_ID = int(os.getenv("PROFILE_ID", "1"))
+REQUESTS_PER_LEVEL = int(os.getenv("REQUESTS_PER_LEVEL", "200"))
+REGRESSION_TOLERANCE = float(os.getenv("REGRESSION_TOLERANCE", "0.2"))
+TIMELINE_PAGE_SIZE = 100
+QUERIES = [
+    "What happened in 1985?",
+    "Tell me about work stories",
+    "Any memories from childhood?",
+    "What did you learn from failure?",
+]
+UNIQUE_QUERIES = False
+
+def chat_query(i):
+    query = QUERIES[i % len(QUERIES)]
+    return f"{query} {i}" if UNIQUE_QUERIES else query
+
+async def chat_request(client, i, record):
+    return await client.post("/chat", json={"query": chat_query(i), "profile_id": PROFILE_ID})
+
+async def chat_stream_request(client, i, record):
+    start = time.perf_counter()
+    async with client.stream("POST", "/chat/stream", json={"query": chat_query(i), "profile_id": PROFILE_ID}) as response:
+        first = True
+        async for _ in response.aiter_bytes():
+            if first:
+                record("chat_stream_ttfb", (time.perf_counter() - start) * 1000)
+                first = False
+    return response
+
+async def story_request(client, i, record):
+    return await client.post("/stories", data={
+        "profile_id": PROFILE_ID,
+        "transcript": f"Load test story {i}: {QUERIES[i % len(QUERIES)]}",
+        "event_year": 1970 + i % 50,
+    })
+
+async def timeline_request(client, i, record):
+    return await client.get(f"/profiles/{PROFILE_ID}/stories", params={"limit": TIMELINE_PAGE_SIZE})
+
+async def timeline_summary_request(client, i, record):
+    return await client.get(
+        f"/profiles/{PROFILE_ID}/stories", params={"limit": TIMELINE_PAGE_SIZE, "fields": "summary"}
+    )
+
+# scenario -> [(kind, weight, send)]
+SCENARIOS = {
+    "chat": [("chat", 1, chat_request)],
+    "chat_stream": [("chat_stream", 1, chat_stream_request)],
+    "stories": [("stories", 1, story_request)],
+    "timeline": [("timeline", 1, timeline_request)],
+    "timeline_summary": [("timeline_summary", 1, timeline_summary_request)],
+    "mixed": [
+        ("timeline", 5, timeline_request),
+        ("chat", 3, chat_request),
+        ("timeline_summary", 1, timeline_summary_request),
+        ("stories", 1, story_request),
+    ],
+}
+
+def request_plan(scenario, n, seed=0):
+    """The kind of each request; seeded so a mix is identical across runs"""
+    entries = SCENARIOS[scenario]
+    rng = random.Random(seed)
+    return rng.choices(entries, weights=[weight for _, weight, _ in entries], k=n)
+
+async def run_level(scenario, concurrency):
+    latencies, errors = {}, {}
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def record(kind, ms):
+        latencies.setdefault(kind, []).append(ms)
+
+    async def one(client, i, kind, send):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await send(client, i, record)
+                if response.status_code >= 400:
+                    errors[kind] = errors.get(kind, 0) + 1
+            except httpx.HTTPError:
+                errors[kind] = errors.get(kind, 0) + 1
+            record(kind, (time.perf_counter() - start) * 1000)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=API_URL, timeout=120, limits=limits) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            one(client, i, kind, send) for i, (kind, _, send) in enumerate(request_plan(scenario, REQUESTS_PER_LEVEL))
+        ))
+        elapsed = time.perf_counter() - start
+
+    result = {"concurrency": concurrency, "throughput": REQUESTS_PER_LEVEL / elapsed, "kinds": {}}
+    for kind, values in sorted(latencies.items()):
+        result["kinds"][kind] = {
+            "count": len(values),
+            "p50": percentile(values, 50),
+            "p95": percentile(values, 95),
+            "p99": percentile(values, 99),
+            "errors": errors.get(kind, 0),
+        }
+    print(f"concurrency={concurrency:4d}  throughput={result['throughput']:8.1f} req/s")
+    for kind, stats in result["kinds"].items():
+        print(
+            f"  {kind:>18}  n={stats['count']:5d}  p50={stats['p50']:8.1f}ms  p95={stats['p95']:8.1f}ms  "
+            f"p99={stats['p99']:8.1f}ms  errors={stats['errors']}"
+        )
+    return result
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Print p95/throughput changes against a baseline run; returns the regressions"""
+    previous = {level["concurrency"]: level for level in baseline["levels"]}
+    regressions = []
+    for level in results["levels"]:
+        before = previous.get(level["concurrency"])
+        if before is None:
+            continue
+        change = level["throughput"] / before["throughput"] - 1
+        print(f"concurrency={level['concurrency']:4d}  throughput {change:+7.1%}")
+        if change < -tolerance:
+            regressions.append(f"concurrency={level['concurrency']} throughput {change:+.1%}")
+        for kind, stats in level["kinds"].items():
+            old = before["kinds"].get(kind)
+            if not old or not old["p95"]:
+                continue
+            change = stats["p95"] / old["p95"] - 1
+            print(f"  {kind:>18}  p95 {old['p95']:8.1f}ms -> {stats['p95']:8.1f}ms  {change:+7.1%}")
+            if change > tolerance:
+                regressions.append(f"concurrency={level['concurrency']} {kind} p95 {change:+.1%}")
+    return regressions
+
+def option(args, name):
+    if name not in args:
+        return None
+    i = args.index(name)
+    value = args[i + 1]
+    del args[i:i + 2]
+    return value
+
+def main():
+    global UNIQUE_QUERIES
+    args = sys.argv[1:]
+    scenario = option(args, "--scenario") or "chat"
+    output = option(args, "--output")
+    baseline = option(args, "--baseline")
+    if "--stories" in args:  # older spelling of --scenario stories
+        scenario = "stories"
+    UNIQUE_QUERIES = "--unique-queries" in args
+    if scenario not in SCENARIOS:
+        print(f"Unknown scenario {scenario}; choose from {', '.join(SCENARIOS)}")
+        sys.exit(1)
+    levels = [int(a) for a in args if not a.startswith("--")] or [1, 2, 4, 8, 16, 32]
+
+    print(f"{API_URL} scenario={scenario} profile={PROFILE_ID}, {REQUESTS_PER_LEVEL} requests per level")
+    results = {
+        "api_url": API_URL,
+        "scenario": scenario,
+        "profile_id": PROFILE_ID,
+        "requests_per_level": REQUESTS_PER_LEVEL,
+        "levels": [asyncio.run(run_level(scenario, concurrency)) for concurrency in levels],
+    }
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {output}")
+    if baseline:
+        with open(baseline) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print(f"Regressions beyond {REGRESSION_TOLERANCE:.0%}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions beyond {REGRESSION_TOLERANCE:.0%}")
+
+if __name__ == "__main__":
+    main()
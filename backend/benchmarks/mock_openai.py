@@ -0,0 +1,130 @@
+"""
+Local stand-in for the OpenAI endpoints the app uses, with configurable latency.
+
+Serves /v1/embeddings, /v1/audio/transcriptions and /v1/chat/completions
+(including `stream=True`). Responses are deterministic: embeddings are
+the app's own feature hashing (as with EMBEDDING_BACKEND=local), transcripts
+and chat replies are picked by a digest of the input. Latency is a fixed
+base plus seeded uniform jitter, so runs are repeatable and OpenAI
+cost/latency never enters a benchmark.
+
+Usage (from backend/):
+  python -m benchmarks.mock_openai                     # :8100
+  MOCK_CHAT_LATENCY_MS=800 MOCK_CHAT_TOKEN_MS=20 python -m benchmarks.mock_openai --port 8100
+
+Then point the API and worker at it (the OpenAI SDK reads OPENAI_BASE_URL):
+  OPENAI_BASE_URL=http://localhost:8100/v1 OPENAI_API_KEY=mock uvicorn main:app
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+import uuid
+import uvicorn
+from fastapi import FastAPI, File, Form, Request, UploadFile
+from fastapi.responses import StreamingResponse
+
+from local_embeddings import local_embeddings
+
+EMBEDDING_LATENCY_MS = float(os.getenv("MOCK_EMBEDDING_LATENCY_MS", "80"))
+# Per input in a batch request, on top of the base latency
+EMBEDDING_ITEM_LATENCY_MS = float(os.getenv("MOCK_EMBEDDING_ITEM_LATENCY_MS", "2"))
+WHISPER_LATENCY_MS = float(os.getenv("MOCK_WHISPER_LATENCY_MS", "1500"))
+# Per MB of audio, roughly how Whisper scales with recording length
+WHISPER_MB_LATENCY_MS = float(os.getenv("MOCK_WHISPER_MB_LATENCY_MS", "500"))
+CHAT_LATENCY_MS = float(os.getenv("MOCK_CHAT_LATENCY_MS", "600"))
+CHAT_TOKEN_MS = float(os.getenv("MOCK_CHAT_TOKEN_MS", "15"))
+JITTER = float(os.getenv("MOCK_JITTER", "0.2"))  # +/- fraction of each delay
+SEED = int(os.getenv("MOCK_SEED", "42"))
+
+CHAT_WORDS = (
+    "I remember that time well and it taught me something I still carry with me "
+    "about patience courage and the people who believed in me when it mattered most"
+).split()
+
+app = FastAPI(title="Mock OpenAI")
+_rng = random.Random(SEED)
+
+async def delay(ms):
+    if ms > 0:
+        await asyncio.sleep(ms * (1 + _rng.uniform(-JITTER, JITTER)) / 1000)
+
+def digest(text):
+    return int(hashlib.sha256(text.encode("utf-8")).hexdigest()[:8], 16)
+
+@app.post("/v1/embeddings")
+async def embeddings(request: Request):
+    body = await request.json()
+    inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+    await delay(EMBEDDING_LATENCY_MS + EMBEDDING_ITEM_LATENCY_MS * len(inputs))
+    tokens = sum(len(text) // 4 + 1 for text in inputs)
+    return {
+        "object": "list",
+        "model": body.get("model", "text-embedding-ada-002"),
+        "data": [
+            {"object": "embedding", "index": i, "embedding": vector.tolist()}
+            for i, vector in enumerate(local_embeddings(inputs))
+        ],
+        "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+    }
+
+@app.post("/v1/audio/transcriptions")
+async def transcriptions(file: UploadFile = File(...), model: str = Form("whisper-1")):
+    data = await file.read()
+    await delay(WHISPER_LATENCY_MS + WHISPER_MB_LATENCY_MS * len(data) / 2**20)
+    n = digest(hashlib.sha256(data).hexdigest())
+    words = [CHAT_WORDS[(n + i * 7) % len(CHAT_WORDS)] for i in range(20 + n % 40)]
+    return {"text": f"Mock transcript of {file.filename}: " + " ".join(words) + "."}
+
+def reply_words(messages):
+    n = digest(json.dumps(messages, sort_keys=True))
+    return [CHAT_WORDS[(n + i * 5) % len(CHAT_WORDS)] for i in range(30 + n % 50)]
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    words = reply_words(body.get("messages", []))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    model = body.get("model", "gpt-3.5-turbo")
+
+    if not body.get("stream"):
+        await delay(CHAT_LATENCY_MS + CHAT_TOKEN_MS * len(words))
+        return {
+            "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+            "choices": [{
+                "index": 0, "finish_reason": "stop",
+                "message": {"role": "assistant", "content": " ".join(words)},
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(words), "total_tokens": len(words)},
+        }
+
+    async def events():
+        await delay(CHAT_LATENCY_MS)
+        for i, word in enumerate(words):
+            chunk = {
+                "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            await delay(CHAT_TOKEN_MS)
+        done = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(done)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+def main():
+    port = int(sys.argv[sys.argv.index("--port") + 1]) if "--port" in sys.argv else 8100
+    print(f"Mock OpenAI on :{port} (embedding {EMBEDDING_LATENCY_MS}ms, whisper {WHISPER_LATENCY_MS}ms, "
+          f"chat {CHAT_LATENCY_MS}ms + {CHAT_TOKEN_MS}ms/token, jitter {JITTER:.0%})")
+    uvicorn.run(app, host="0.0.0.0", port=port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Profile-scoped search latency as the number of profiles grows.
+
+One large profile plus a growing number of small profiles share a throwaway
+`bench_profile_stories` table. At each step the script reports p50/p99 latency
+and recall for queries scoped to a small profile and to the large one. With
+per-profile partial indexes the small-profile p99 should stay flat.
+
+Usage (from backend/):
+  python -m benchmarks.profile_scaling                    # 10, 100, 500 small profiles
+  python -m benchmarks.profile_scaling 10 100 1000
+  python -m benchmarks.profile_scaling --global 10 100    # global index only, for comparison
+"""
+import sys
+import numpy as np
+from sqlalchemy import text
+
+from database import engine, create_vector_index, create_profile_vector_index
+from benchmarks.common import synthetic_embeddings, vector_literal, copy_rows, percentile, timed
+
+TABLE = "bench_profile_stories"
+LARGE_PROFILE_STORIES = 200_000
+SMALL_PROFILE_STORIES = 200
+TOP_K = 5
+N_QUERIES = 200
+
+def add_profile(profile_id, n, rng, per_profile):
+    for start in range(0, n, 10_000):
+        batch = synthetic_embeddings(min(10_000, n - start), rng)
+        copy_rows(engine, TABLE, ["profile_id", "embedding"], ((profile_id, vector_literal(v)) for v in batch))
+    if per_profile:
+        create_profile_vector_index(profile_id, table=TABLE, storage="full")
+
+def search(conn, profile_id, query, exact=False):
+    with conn.begin():
+        if exact:
+            conn.execute(text("SET LOCAL enable_indexscan = off"))
+        rows = conn.execute(
+            text(f"SELECT id FROM {TABLE} WHERE profile_id = :p ORDER BY embedding <=> :q LIMIT {TOP_K}"),
+            {"p": profile_id, "q": query},
+        ).fetchall()
+    return {r[0] for r in rows}
+
+def measure(conn, profile_ids, rng):
+    latencies, recalls = [], []
+    queries = [vector_literal(v) for v in synthetic_embeddings(N_QUERIES, rng)]
+    for query in queries:
+        profile_id = int(rng.choice(profile_ids))
+        ids, ms = timed(search, conn, profile_id, query)
+        expected = search(conn, profile_id, query, exact=True)
+        latencies.append(ms)
+        recalls.append(len(ids & expected) / max(len(expected), 1))
+    return percentile(latencies, 50), percentile(latencies, 99), float(np.mean(recalls))
+
+def main():
+    args = sys.argv[1:]
+    per_profile = "--global" not in args
+    steps = [int(a) for a in args if a != "--global"] or [10, 100, 500]
+    rng = np.random.default_rng(7)
+    
+    with engine.connect() as conn:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS vector"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+        conn.execute(text(f"CREATE TABLE {TABLE} (id serial PRIMARY KEY, profile_id integer NOT NULL, embedding vector(1536))"))
+        conn.execute(text(f"CREATE INDEX ON {TABLE} (profile_id)"))
+        conn.commit()
+    
+    try:
+        print(f"mode: {'per-profile partial indexes' if per_profile else 'global index only'}")
+        add_profile(0, LARGE_PROFILE_STORIES, rng, per_profile)
+        with engine.connect() as conn:
+            create_vector_index(conn, table=TABLE, storage="full")
+        
+        n_small = 0
+        for target in steps:
+            while n_small < target:
+                n_small += 1
+                add_profile(n_small, SMALL_PROFILE_STORIES, rng, per_profile)
+            with engine.connect() as conn:
+                conn.execute(text(f"ANALYZE {TABLE}"))
+                conn.commit()
+                small = measure(conn, list(range(1, n_small + 1)), rng)
+                large = measure(conn, [0], rng)
+            print(
+                f"profiles={n_small + 1:5d}  "
+                f"small: p50={small[0]:6.2f}ms p99={small[1]:6.2f}ms recall={small[2]:.3f}  "
+                f"large: p50={large[0]:6.2f}ms p99={large[1]:6.2f}ms recall={large[2]:.3f}"
+            )
+    finally:
+        with engine.connect() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {TABLE}"))
+            conn.commit()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Synthetic story corpus at any scale, built from data/stories.csv.
+
+Each synthetic story recombines sentences from the seed transcripts (with a
+seeded RNG, so the same arguments always give the same corpus) and gets a
+year near its seed story's. Embeddings come from local_embeddings, the
+feature hashing behind EMBEDDING_BACKEND=local and the mock OpenAI server,
+so queries against a loaded corpus retrieve by shared words rather than at
+random.
+
+Usage (from backend/):
+  python -m benchmarks.synthetic_corpus csv 1000000 /tmp/stories_1m.csv     # stories.csv format
+  python -m benchmarks.synthetic_corpus load 100000 --profiles 10           # straight into Postgres
+
+`load` creates the profiles, COPYs the stories as ready rows (no chunks),
+builds the per-profile vector indexes and prints the new profile IDs for
+PROFILE_ID in the load test.
+"""
+import csv
+import os
+import re
+import sys
+import time
+import numpy as np
+from sqlalchemy import text
+
+from database import engine, SessionLocal, Profile, create_profile_vector_indexes
+from local_embeddings import local_embeddings
+from benchmarks.common import vector_literal, copy_rows
+
+SEED_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "stories.csv")
+BATCH_SIZE = 5000
+
+def load_seed(path=SEED_CSV):
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = [row for row in csv.DictReader(f) if row["transcript"].strip()]
+    sentences = [s for row in rows for s in re.split(r"(?<=[.!?])\s+", row["transcript"].strip()) if s]
+    return rows, sentences
+
+def generate(n, seed=7, path=SEED_CSV):
+    """Yield n (year, title, transcript) tuples"""
+    rows, sentences = load_seed(path)
+    rng = np.random.default_rng(seed)
+    for i in range(n):
+        base = rows[i % len(rows)]
+        year = int(base["year"]) + int(rng.integers(-5, 6)) if base["year"] else None
+        picks = rng.integers(0, len(sentences), int(rng.integers(3, 9)))
+        yield year, f"{base['title']} #{i}", " ".join(sentences[j] for j in picks)
+
+def write_csv(n, out_path):
+    start = time.perf_counter()
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["year", "title", "transcript"])
+        writer.writerows(generate(n))
+    print(f"Wrote {n:,} stories to {out_path} in {time.perf_counter() - start:.1f}s")
+
+def _copy_value(value):
+    # COPY text format: escape the characters it treats specially
+    return value.replace("\\", "\\\\").replace("\t", " ").replace("\n", " ").replace("\r", " ")
+
+def load(n, n_profiles):
+    db = SessionLocal()
+    try:
+        profiles = [Profile(name=f"Synthetic {i}", relation="benchmark") for i in range(n_profiles)]
+        db.add_all(profiles)
+        db.commit()
+        profile_ids = [p.id for p in profiles]
+    finally:
+        db.close()
+
+    start = time.perf_counter()
+    stories = generate(n)
+    loaded = 0
+    while loaded < n:
+        batch = [next(stories) for _ in range(min(BATCH_SIZE, n - loaded))]
+        vectors = local_embeddings([transcript for _, _, transcript in batch])
+        copy_rows(engine, "stories", ["profile_id", "transcript", "event_year", "embedding", "status"], (
+            (profile_ids[(loaded + i) % n_profiles], _copy_value(transcript), year, vector_literal(vector), "ready")
+            for i, ((year, _, transcript), vector) in enumerate(zip(batch, vectors))
+        ))
+        loaded += len(batch)
+        print(f"  {loaded:,}/{n:,} stories ({loaded / (time.perf_counter() - start):,.0f} rows/s)")
+
+    for profile_id in profile_ids:
+        create_profile_vector_indexes(profile_id)
+    with engine.connect() as conn:
+        conn.execute(text("ANALYZE stories"))
+        conn.commit()
+    print(f"Loaded {n:,} stories into profiles {profile_ids} in {time.perf_counter() - start:.1f}s")
+
+def main():
+    args = sys.argv[1:]
+    if len(args) < 2 or args[0] not in ("csv", "load"):
+        print(__doc__)
+        sys.exit(1)
+    n = int(args[1])
+    if args[0] == "csv":
+        write_csv(n, args[2] if len(args) > 2 else "stories_synthetic.csv")
+    else:
+        n_profiles = int(args[args.index("--profiles") + 1]) if "--profiles" in args else 1
+        load(n, n_profiles)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Peak RSS of storing an upload, streamed vs read-into-memory.
+
+Each measurement runs in a fresh process so ru_maxrss reflects that upload
+alone. Streamed uploads (storage.save_upload) should stay flat as the file
+grows; the old `await audio.read()` path grows with the file.
+
+Usage (from backend/):
+  python -m benchmarks.upload_memory               # 10 MB, 100 MB, 1000 MB
+  python -m benchmarks.upload_memory 50 500        # sizes in MB
+"""
+import asyncio
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+from starlette.datastructures import UploadFile
+
+import storage
+
+def make_source(path, size_mb):
+    block = os.urandom(1024 * 1024)
+    with open(path, "wb") as f:
+        for _ in range(size_mb):
+            f.write(block)
+
+async def read_all(upload, target_dir):
+    content = await upload.read()
+    with open(os.path.join(target_dir, "upload.bin"), "wb") as f:
+        f.write(content)
+
+def measure(mode, source, target_dir, result):
+    storage.STORAGE_DIR = target_dir
+    with open(source, "rb") as f:
+        upload = UploadFile(file=f, filename="recording.mp3")
+        if mode == "streamed":
+            asyncio.run(storage.save_upload(upload, max_bytes=1 << 62))
+        else:
+            asyncio.run(read_all(upload, target_dir))
+    # ru_maxrss is KiB on Linux
+    result.value = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def main():
+    sizes = [int(a) for a in sys.argv[1:]] or [10, 100, 1000]
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as workdir:
+        for size_mb in sizes:
+            source = os.path.join(workdir, f"source-{size_mb}.bin")
+            make_source(source, size_mb)
+            row = []
+            for mode in ("streamed", "read-all"):
+                target_dir = tempfile.mkdtemp(dir=workdir)
+                result = ctx.Value("d", 0.0)
+                process = ctx.Process(target=measure, args=(mode, source, target_dir, result))
+                process.start()
+                process.join()
+                row.append(f"{mode}: peak RSS {result.value:8.1f} MB")
+            os.remove(source)
+            print(f"{size_mb:6d} MB upload  " + "  ".join(row))
+
+if __name__ == "__main__":
+    main()
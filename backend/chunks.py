@@ -0,0 +1,93 @@
+"""
+Transcript chunking for multi-vector retrieval.
+
+Long transcripts are split into overlapping word windows, each embedded on
+its own and stored in `story_chunks`. /chat then ranks a story by its best
+matching chunk, so one relevant passage is not diluted by the rest of the
+story (or lost to the embedding model's input limit).
+"""
+import os
+from sqlalchemy import insert
+
+from database import SessionLocal, Story, StoryChunk
+from embeddings import embed_texts, EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY
+
+CHUNK_WORDS = int(os.getenv("CHUNK_WORDS", "150"))
+CHUNK_OVERLAP_WORDS = int(os.getenv("CHUNK_OVERLAP_WORDS", "30"))
+BACKFILL_PAGE_SIZE = 500
+
+def needs_chunks(text):
+    return len((text or "").split()) > CHUNK_WORDS
+
+def split_transcript(text, window=CHUNK_WORDS, overlap=CHUNK_OVERLAP_WORDS):
+    """Overlapping word windows; a short transcript is a single chunk"""
+    words = (text or "").split()
+    if len(words) <= window:
+        return [" ".join(words)] if words else []
+    step = max(window - overlap, 1)
+    chunks = []
+    for start in range(0, len(words), step):
+        chunks.append(" ".join(words[start:start + window]))
+        if start + window >= len(words):
+            break
+    return chunks
+
+def build_chunks(db, stories, client, batch_size=EMBEDDING_BATCH_SIZE, concurrency=EMBEDDING_CONCURRENCY):
+    """Replace the chunks of the given stories, embedding every window in batched requests.
+
+    A transcript that fits in one window gets no chunks: its whole-story
+    embedding already is that window. Chunks whose embedding cannot be
+    produced are stored without one and the story stays searchable through
+    its whole-story embedding.
+    """
+    plan = []
+    for story in stories:
+        windows = split_transcript(story.transcript)
+        if len(windows) > 1:
+            plan.extend((story, i, chunk) for i, chunk in enumerate(windows))
+    embeddings = embed_texts([chunk for _, _, chunk in plan], client, batch_size=batch_size, concurrency=concurrency)
+    
+    story_ids = [story.id for story in stories]
+    if story_ids:
+        db.query(StoryChunk).filter(StoryChunk.story_id.in_(story_ids)).delete(synchronize_session=False)
+    rows = [
+        {
+            "story_id": story.id,
+            "profile_id": story.profile_id,
+            "chunk_index": i,
+            "text": chunk,
+            "embedding": embedding
+        }
+        for (story, i, chunk), embedding in zip(plan, embeddings)
+    ]
+    if rows:
+        db.execute(insert(StoryChunk), rows)
+    return len(rows)
+
+def backfill_chunks(client, batch_size=EMBEDDING_BATCH_SIZE, concurrency=EMBEDDING_CONCURRENCY):
+    """Chunk every ready story that has no chunks yet (existing data, bulk loads)"""
+    db = SessionLocal()
+    total_stories = total_chunks = last_id = 0
+    try:
+        while True:
+            # Keyset paging, so stories that produce no chunks are not picked up again
+            stories = (
+                db.query(Story)
+                .filter(Story.id > last_id, Story.status == "ready", Story.transcript.isnot(None), ~Story.chunks.any())
+                .order_by(Story.id)
+                .limit(BACKFILL_PAGE_SIZE)
+                .all()
+            )
+            if not stories:
+                break
+            last_id = stories[-1].id
+            total_chunks += build_chunks(db, stories, client, batch_size, concurrency)
+            total_stories += len(stories)
+            db.commit()
+            print(f"Chunked {total_stories} stories ({total_chunks} chunks)")
+    except Exception as e:
+        print(f"Error chunking stories: {e}")
+        db.rollback()
+    finally:
+        db.close()
+    return total_stories, total_chunks
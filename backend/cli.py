@@ -2,29 +2,169 @@
 """
 CLI script for data management operations
 """
+import glob
+import os
 import sys
-from load_data import load_stories_from_csv
+import tempfile
+import uvicorn
+from load_data import load_stories_from_csv, import_stories_csv, get_openai_client, CSV_PATH, IMPORT_BATCH_SIZE
+from database import create_tables, rebuild_vector_index, sync_profile_vector_indexes, migrate_embedding_storage, EMBEDDING_STORAGE
+from embeddings import EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY
+from jobs import run_worker, enqueue_transcodes, WORKER_CONCURRENCY
+from chunks import backfill_chunks
+from database import SessionLocal
+from storage import collect_garbage
+from vector_store import vector_store, VECTOR_STORE_DIR
+from prompt_context import backfill_summaries
+from metrics import METRICS_ENABLED
+
+def get_option(name, default, cast=int):
+    """Read a `--name value` option from the command line"""
+    flag = f"--{name}"
+    if flag in sys.argv:
+        index = sys.argv.index(flag)
+        if index + 1 < len(sys.argv):
+            return cast(sys.argv[index + 1])
+    return default
+
+def default_workers():
+    """WEB_CONCURRENCY, else the CPUs this process may run on (respects container CPU sets)"""
+    if os.getenv("WEB_CONCURRENCY"):
+        return int(os.getenv("WEB_CONCURRENCY"))
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
 
 def main():
     if len(sys.argv) < 2:
         print("Usage:")
+        print("  python cli.py migrate     # Create/upgrade tables and indexes (run once per deploy, before serve)")
+        print("  python cli.py serve       # Run the API with several worker processes")
         print("  python cli.py load        # Load data (skip if already exists)")
         print("  python cli.py reload      # Force reload data (clears existing)")
+        print("  python cli.py import [--path P]  # Incremental CSV import: new/changed rows only, removed rows deleted")
+        print("  python cli.py reindex     # Rebuild the vector indexes (e.g. after a bulk load)")
+        print("  python cli.py profile-indexes  # Create/drop per-profile vector indexes for existing data")
+        print("  python cli.py embedding-storage  # Convert existing embeddings/indexes to EMBEDDING_STORAGE")
+        print("  python cli.py chunk       # Split long transcripts into embedded chunks (existing data)")
+        print("  python cli.py summarize   # Compute prompt-context summaries for stories without one")
+        print("  python cli.py worker      # Run the background job worker (audio transcription, embedding)")
+        print("  python cli.py transcode   # Queue transcode + waveform jobs for existing audio stories")
+        print("  python cli.py gc-audio    # Delete stored audio no story or chunk refers to (--dry-run to list)")
+        print("  python cli.py vector-store  # Rebuild the VECTOR_BACKEND=memory snapshots for every profile")
+        print("")
+        print("Options for load/reload/chunk:")
+        print(f"  --batch-size N     Texts per embedding request (default {EMBEDDING_BATCH_SIZE})")
+        print(f"  --concurrency N    Embedding requests in flight (default {EMBEDDING_CONCURRENCY})")
+        print("")
+        print("Options for import (plus --batch-size/--concurrency):")
+        print(f"  --path P           CSV file (default {CSV_PATH})")
+        print("  --profile-id N     Import into this profile (default: the sample profile)")
+        print(f"  --import-batch N   Rows per transaction (default {IMPORT_BATCH_SIZE})")
+        print("  --keep-missing     Do not delete stories whose row is no longer in the file")
+        print("")
+        print("Options for serve:")
+        print(f"  --workers N        API worker processes (default WEB_CONCURRENCY or CPU count: {default_workers()})")
+        print("  --host H           Bind address (default 0.0.0.0)")
+        print("  --port N           Port (default 8000)")
+        print("")
+        print("Options for worker:")
+        print(f"  --concurrency N    Worker threads (default {WORKER_CONCURRENCY})")
         return
     
     command = sys.argv[1].lower()
+    batch_size = get_option("batch-size", EMBEDDING_BATCH_SIZE)
+    concurrency = get_option("concurrency", EMBEDDING_CONCURRENCY)
     
-    if command == "load":
+    if command == "migrate":
+        print("Migrating database schema...")
+        create_tables()
+        
+    elif command == "serve":
+        workers = get_option("workers", default_workers())
+        if METRICS_ENABLED and workers > 1:
+            # Workers snapshot their metrics here; /metrics sums them. Stale files from a previous run go first
+            metrics_dir = os.environ.setdefault("METRICS_MULTIPROC_DIR", tempfile.mkdtemp(prefix="bardo-metrics-"))
+            os.makedirs(metrics_dir, exist_ok=True)
+            for path in glob.glob(os.path.join(metrics_dir, "metrics-*.json")):
+                os.remove(path)
+        print(f"Serving the API with {workers} worker processes")
+        uvicorn.run(
+            "main:app",
+            host=get_option("host", "0.0.0.0", cast=str),
+            port=get_option("port", 8000),
+            workers=workers,
+            proxy_headers=True,
+            forwarded_allow_ips="*",
+        )
+        
+    elif command == "load":
         print("Loading data from CSV...")
-        load_stories_from_csv(clear_existing=False)
+        load_stories_from_csv(clear_existing=False, batch_size=batch_size, concurrency=concurrency)
         
     elif command == "reload":
         print("Reloading data (clearing existing)...")
-        load_stories_from_csv(clear_existing=True)
+        load_stories_from_csv(clear_existing=True, batch_size=batch_size, concurrency=concurrency)
+        
+    elif command == "import":
+        path = get_option("path", CSV_PATH, cast=str)
+        print(f"Importing {path}...")
+        result = import_stories_csv(
+            path,
+            profile_id=get_option("profile-id", None),
+            delete_missing="--keep-missing" not in sys.argv,
+            batch_size=get_option("import-batch", IMPORT_BATCH_SIZE),
+            embedding_batch_size=batch_size,
+            concurrency=concurrency
+        )
+        if result is None:
+            sys.exit(1)
+        
+    elif command == "reindex":
+        print("Rebuilding vector index...")
+        rebuild_vector_index()
+        
+    elif command == "profile-indexes":
+        print("Syncing per-profile vector indexes...")
+        sync_profile_vector_indexes()
+        
+    elif command == "embedding-storage":
+        print(f"Migrating embeddings to {EMBEDDING_STORAGE} storage...")
+        migrate_embedding_storage()
+        
+    elif command == "chunk":
+        print("Chunking stories without chunks...")
+        backfill_chunks(get_openai_client(), batch_size=batch_size, concurrency=concurrency)
+        
+    elif command == "summarize":
+        print(f"Summarized {backfill_summaries()} stories")
+        
+    elif command == "worker":
+        run_worker(concurrency=get_option("concurrency", WORKER_CONCURRENCY))
+        
+    elif command == "transcode":
+        print(f"Queued {enqueue_transcodes()} transcode jobs; run `python cli.py worker` to process them")
+        
+    elif command == "gc-audio":
+        dry_run = "--dry-run" in sys.argv
+        db = SessionLocal()
+        try:
+            removed, freed = collect_garbage(db, dry_run=dry_run)
+        finally:
+            db.close()
+        print(f"{'Would remove' if dry_run else 'Removed'} {removed} unreferenced audio files ({freed / 2**20:.1f} MB)")
+        
+    elif command == "vector-store":
+        db = SessionLocal()
+        try:
+            profiles, vectors = vector_store.rebuild_all(db)
+        finally:
+            db.close()
+        print(f"Wrote {vectors} story vectors for {profiles} profiles to {VECTOR_STORE_DIR}")
         
     else:
         print(f"Unknown command: {command}")
-        print("Available commands: load, reload")
+        print("Available commands: migrate, serve, load, reload, import, reindex, profile-indexes, embedding-storage, chunk, summarize, worker, transcode, gc-audio, vector-store")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -52,7 +52,8 @@ def slice_audio():
     for s in SLICES:
         clip = audio[s["start"]:s["end"]]
         out_path = os.path.join(OUTPUT_DIR, f"{s['title']}.mp3")
-        clip.export(out_path, format="mp3", bitrate="192k")
+        # Mono 64k is transparent for speech; 192k stereo only tripled the size
+        clip.set_channels(1).export(out_path, format="mp3", bitrate="64k")
         print(f"Exported segment: {out_path}")
 
 if __name__ == "__main__":
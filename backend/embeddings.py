@@ -0,0 +1,258 @@
+"""
+Shared embedding generation with a two-tier cache.
+
+Embeddings are keyed by sha256(model + text). Lookups go to an in-process
+LRU first, then to the `embedding_cache` table, and only then to OpenAI.
+Both tiers are bounded by entry count and keep hit/miss counters.
+
+With EMBEDDING_BACKEND=local nothing is sent to OpenAI: every text goes
+through local_embeddings' feature hashing, which is cheaper than a cache
+lookup, so neither tier is used.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+from database import SessionLocal, EmbeddingCacheEntry
+from local_embeddings import local_embedding, local_embeddings
+from metrics import openai_call
+
+# "openai" (text-embedding-ada-002, local hashing only as a fallback) or "local"
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai").lower()
+if EMBEDDING_BACKEND not in ("openai", "local"):
+    raise ValueError(f"Unknown EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+EMBEDDING_MODEL = "text-embedding-ada-002"
+# text-embedding-ada-002 rejects inputs over 8191 tokens; ~3 characters per token keeps
+# even token-dense text under the limit. Long transcripts are covered by story_chunks.
+EMBEDDING_MAX_CHARS = int(os.getenv("EMBEDDING_MAX_CHARS", "24000"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "2048"))
+EMBEDDING_CACHE_DB_MAX_ROWS = int(os.getenv("EMBEDDING_CACHE_DB_MAX_ROWS", "100000"))
+EMBEDDING_CACHE_DB = os.getenv("EMBEDDING_CACHE_DB", "true").lower() == "true"
+
+# Bulk embedding: inputs per request, estimated tokens per request, parallel requests
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "100"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+
+# Trim the persistent tier once every N inserts rather than on every write
+DB_EVICT_EVERY = 100
+
+def truncate_for_embedding(text):
+    return text[:EMBEDDING_MAX_CHARS]
+
+def embeddings_available(client):
+    """Whether embed_text can succeed without falling back"""
+    return EMBEDDING_BACKEND == "local" or client is not None
+
+def cache_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE, db_max_rows=EMBEDDING_CACHE_DB_MAX_ROWS, use_db=EMBEDDING_CACHE_DB):
+        self.max_entries = max_entries
+        self.db_max_rows = db_max_rows
+        self.use_db = use_db
+        self._entries = OrderedDict()  # key -> float32 array, most recently used last
+        self._lock = threading.Lock()
+        self._db_writes = 0
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        return self.get_many([key])[0]
+
+    def get_many(self, keys):
+        """Look up several keys with at most one database round-trip"""
+        found = {}
+        with self._lock:
+            for key in keys:
+                vector = self._entries.get(key)
+                if vector is not None:
+                    self._entries.move_to_end(key)
+                    self.memory_hits += 1
+                    found[key] = vector
+        
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        from_db = self._db_get_many(missing) if missing else {}
+        with self._lock:
+            self.db_hits += len(from_db)
+            self.misses += len(missing) - len(from_db)
+        for key, vector in from_db.items():
+            self._remember(key, vector)
+        found.update(from_db)
+        return [found[key].tolist() if key in found else None for key in keys]
+
+    def put(self, key, model, embedding):
+        self.put_many([(key, model, embedding)])
+
+    def put_many(self, items):
+        """Store (key, model, embedding) tuples in both tiers"""
+        rows = [(key, model, np.asarray(embedding, dtype=np.float32)) for key, model, embedding in items]
+        for key, _, vector in rows:
+            self._remember(key, vector)
+        self._db_put_many(rows)
+
+    def _remember(self, key, vector):
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _db_get_many(self, keys):
+        if not self.use_db:
+            return {}
+        db = SessionLocal()
+        try:
+            entries = db.query(EmbeddingCacheEntry).filter(EmbeddingCacheEntry.key.in_(keys)).all()
+            if entries:
+                db.query(EmbeddingCacheEntry).filter(
+                    EmbeddingCacheEntry.key.in_([entry.key for entry in entries])
+                ).update({"last_used_at": datetime.utcnow()}, synchronize_session=False)
+                db.commit()
+            return {entry.key: np.asarray(entry.embedding, dtype=np.float32) for entry in entries}
+        except Exception as e:
+            print(f"Embedding cache lookup failed: {e}")
+            db.rollback()
+            return {}
+        finally:
+            db.close()
+
+    def _db_put_many(self, rows):
+        if not self.use_db or not rows:
+            return
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            for key, model, vector in rows:
+                db.merge(EmbeddingCacheEntry(key=key, model=model, embedding=vector, last_used_at=now))
+            db.commit()
+            with self._lock:
+                before = self._db_writes
+                self._db_writes += len(rows)
+                evict = before // DB_EVICT_EVERY != self._db_writes // DB_EVICT_EVERY
+            if evict:
+                db.execute(text("""
+                    DELETE FROM embedding_cache WHERE key IN (
+                        SELECT key FROM embedding_cache ORDER BY last_used_at DESC OFFSET :max_rows
+                    )
+                """), {"max_rows": self.db_max_rows})
+                db.commit()
+        except Exception as e:
+            print(f"Embedding cache write failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.memory_hits + self.db_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "memory_hits": self.memory_hits,
+                "db_hits": self.db_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.memory_hits + self.db_hits) / lookups if lookups else 0.0,
+            }
+
+embedding_cache = EmbeddingCache()
+
+def embed_text(text, client, model=EMBEDDING_MODEL):
+    """Return the embedding for text, calling OpenAI only on a cache miss"""
+    if EMBEDDING_BACKEND == "local":
+        return local_embedding(text)
+    text = truncate_for_embedding(text)
+    key = cache_key(model, text)
+    embedding = embedding_cache.get(key)
+    if embedding is not None:
+        return embedding
+    
+    if client is None:
+        raise Exception("OpenAI client not available")
+    with openai_call("embedding"):
+        response = client.embeddings.create(model=model, input=text)
+    embedding = response.data[0].embedding
+    embedding_cache.put(key, model, embedding)
+    return embedding
+
+async def aembed_text(text, client, model=EMBEDDING_MODEL):
+    """embed_text for request handlers: cache tiers run in the threadpool and an
+    AsyncOpenAI client is awaited, so the event loop is never blocked"""
+    if EMBEDDING_BACKEND == "local":
+        return await run_in_threadpool(local_embedding, text)
+    text = truncate_for_embedding(text)
+    key = cache_key(model, text)
+    embedding = await run_in_threadpool(embedding_cache.get, key)
+    if embedding is not None:
+        return embedding
+    
+    if client is None:
+        raise Exception("OpenAI client not available")
+    with openai_call("embedding"):
+        response = await client.embeddings.create(model=model, input=text)
+    embedding = response.data[0].embedding
+    await run_in_threadpool(embedding_cache.put, key, model, embedding)
+    return embedding
+
+def estimate_tokens(text):
+    # ~4 characters per token for English text; avoids a tokenizer dependency
+    return len(text) // 4 + 1
+
+def make_batches(texts, batch_size=EMBEDDING_BATCH_SIZE, max_tokens=EMBEDDING_BATCH_MAX_TOKENS):
+    """Group texts into request-sized batches bounded by input count and estimated tokens"""
+    batches, batch, tokens = [], [], 0
+    for text in texts:
+        n = estimate_tokens(text)
+        if batch and (len(batch) >= batch_size or tokens + n > max_tokens):
+            batches.append(batch)
+            batch, tokens = [], 0
+        batch.append(text)
+        tokens += n
+    if batch:
+        batches.append(batch)
+    return batches
+
+def embed_texts(texts, client, model=EMBEDDING_MODEL, batch_size=EMBEDDING_BATCH_SIZE, concurrency=EMBEDDING_CONCURRENCY):
+    """Embed many texts with as few requests as possible, several in flight at once.
+
+    Returns one embedding per input, or None where no embedding could be produced
+    (no client or a failed batch) so callers can apply their own fallback.
+    """
+    if EMBEDDING_BACKEND == "local":
+        return [vector.tolist() for vector in local_embeddings(texts)]
+    texts = [truncate_for_embedding(t) for t in texts]
+    unique = list(dict.fromkeys(texts))
+    cached = embedding_cache.get_many([cache_key(model, t) for t in unique])
+    results = {t: e for t, e in zip(unique, cached) if e is not None}
+    missing = [t for t in unique if t not in results]
+    
+    if missing and client is not None:
+        def embed_batch(batch):
+            with openai_call("embedding_batch"):
+                response = client.embeddings.create(model=model, input=batch)
+            return batch, [d.embedding for d in sorted(response.data, key=lambda d: d.index)]
+        
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+            futures = [pool.submit(embed_batch, batch) for batch in make_batches(missing, batch_size)]
+            for future in as_completed(futures):
+                try:
+                    batch, embeddings = future.result()
+                except Exception as e:
+                    print(f"Embedding batch failed: {e}")
+                    continue
+                embedding_cache.put_many([(cache_key(model, t), model, e) for t, e in zip(batch, embeddings)])
+                results.update(zip(batch, embeddings))
+    
+    return [results.get(t) for t in texts]
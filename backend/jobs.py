@@ -0,0 +1,281 @@
+"""
+Postgres-backed job queue for work that should not run inside an HTTP request.
+
+Jobs live in the `jobs` table and are claimed with SELECT ... FOR UPDATE SKIP
+LOCKED, so any number of worker threads or processes can share the queue
+without an external broker. Failed jobs are retried with exponential backoff.
+"""
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from openai import OpenAI
+from sqlalchemy import or_, and_, update
+
+from database import engine, SessionLocal, Story, StoryChunk, Job
+from embeddings import embed_text, embed_texts, embeddings_available
+from local_embeddings import local_embedding
+from metrics import JOB_SECONDS, fallback, start_metrics_server, METRICS_ENABLED
+from storage import STORAGE_DIR, release_file
+from transcode import transcode, TRANSCODE_ON_INGEST, TRANSCODE_KEEP_ORIGINAL
+from chunks import build_chunks
+from prompt_context import summarize
+from audio_segments import audio_duration_ms, segment_and_transcribe, stitch_transcripts, transcribe_file, SEGMENT_THRESHOLD_MS
+
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_DELAY = float(os.getenv("JOB_RETRY_BASE_DELAY", "5"))
+# A running job whose worker has been silent this long is assumed dead and reclaimed
+JOB_LOCK_TIMEOUT = int(os.getenv("JOB_LOCK_TIMEOUT", "900"))
+# How often a running job refreshes its locked_at; well inside JOB_LOCK_TIMEOUT
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", str(JOB_LOCK_TIMEOUT / 3)))
+WORKER_CONCURRENCY = int(os.getenv("WORKER_CONCURRENCY", "4"))
+# Prometheus scrape port for the worker process (the API serves /metrics itself)
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "9101"))
+
+def get_openai_client():
+    try:
+        return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    except Exception as e:
+        print(f"OpenAI client initialization error: {e}")
+        return None
+
+def enqueue_job(db, kind, story_id=None, payload=None, max_attempts=JOB_MAX_ATTEMPTS):
+    """Add a job to the caller's transaction; it becomes visible to workers on commit"""
+    job = Job(kind=kind, story_id=story_id, payload=payload or {}, max_attempts=max_attempts)
+    db.add(job)
+    return job
+
+def latest_job(db, story_id):
+    return db.query(Job).filter(Job.story_id == story_id).order_by(Job.id.desc()).first()
+
+def process_audio_job(db, job):
+    """Transcribe an uploaded recording, embed the transcript and mark the story ready"""
+    story = db.query(Story).filter(Story.id == job.story_id).first()
+    if story is None:
+        return
+    client = get_openai_client()
+
+    if not story.transcript:
+        if client is None:
+            # Fallback: use filename as transcript for demo purposes
+            fallback("filename_transcript")
+            story.transcript = f"Audio file: {job.payload.get('original_filename', story.audio_path)}"
+            story.transcript_source = "fallback"
+        else:
+            audio_path = os.path.join(STORAGE_DIR, story.audio_path)
+            if audio_duration_ms(audio_path) > SEGMENT_THRESHOLD_MS:
+                store_segments(db, story, segment_and_transcribe(
+                    audio_path, client, STORAGE_DIR, os.path.splitext(story.audio_path)[0]
+                ), client)
+            else:
+                story.transcript = transcribe_file(audio_path, client)
+            story.transcript_source = "whisper"
+        story.summary = summarize(story.transcript)
+        # Keep the transcript even if embedding fails, so a retry does not re-run Whisper
+        db.commit()
+
+    if not embeddings_available(client):
+        # Fallback: local hashing embedding, the same one queries fall back to
+        fallback("local_embedding")
+        story.embedding = local_embedding(story.transcript)
+    else:
+        story.embedding = embed_text(story.transcript, client)
+        # Segmented recordings already have one chunk per segment
+        if not db.query(StoryChunk.id).filter(StoryChunk.story_id == story.id).first():
+            build_chunks(db, [story], client)
+    story.status = "ready"
+    if TRANSCODE_ON_INGEST:
+        # After transcription, so Whisper always hears the original
+        enqueue_job(db, "transcode_audio", story_id=story.id)
+    db.commit()
+
+def chunk_story_job(db, job):
+    """Split a story's transcript into embedded chunks for multi-vector retrieval"""
+    story = db.query(Story).filter(Story.id == job.story_id).first()
+    if story is None or not story.transcript:
+        return
+    build_chunks(db, [story], get_openai_client())
+    db.commit()
+
+def transcode_audio_job(db, job):
+    """Replace a story's audio with a compact speech encoding and record waveform peaks"""
+    story = db.query(Story).filter(Story.id == job.story_id).first()
+    if story is None or not story.audio_path or story.waveform is not None:
+        return
+    original_path = story.audio_path
+    transcoded_path, duration_ms, peaks = transcode(os.path.join(STORAGE_DIR, original_path))
+    
+    story.duration_ms = duration_ms
+    story.waveform = peaks
+    if transcoded_path:
+        story.audio_path = transcoded_path
+        if TRANSCODE_KEEP_ORIGINAL:
+            story.original_audio_path = original_path
+    db.commit()
+    if transcoded_path and not TRANSCODE_KEEP_ORIGINAL:
+        # Other stories may share the same upload; only the last reference deletes it
+        release_file(db, original_path)
+
+def store_segments(db, story, segments, client):
+    """Stitch segment transcripts into the story and keep each segment as a searchable chunk"""
+    story.transcript = stitch_transcripts(segments)
+    db.query(StoryChunk).filter(StoryChunk.story_id == story.id).delete()
+    embeddings = embed_texts([segment["text"] or " " for segment in segments], client)
+    for i, (segment, embedding) in enumerate(zip(segments, embeddings)):
+        db.add(StoryChunk(
+            story_id=story.id,
+            profile_id=story.profile_id,
+            chunk_index=i,
+            text=segment["text"],
+            start_ms=segment["start_ms"],
+            end_ms=segment["end_ms"],
+            audio_path=segment["audio_path"],
+            embedding=embedding
+        ))
+
+def enqueue_transcodes():
+    """Queue transcode jobs for existing stories whose audio has not been through the ingest stage"""
+    db = SessionLocal()
+    try:
+        pending = db.query(Job.story_id).filter(Job.kind == "transcode_audio", Job.status.in_(("queued", "running")))
+        story_ids = [
+            story_id for (story_id,) in db.query(Story.id).filter(
+                Story.audio_path.isnot(None), Story.waveform.is_(None), Story.status == "ready",
+                Story.id.notin_(pending)
+            )
+        ]
+        for story_id in story_ids:
+            enqueue_job(db, "transcode_audio", story_id=story_id)
+        db.commit()
+        return len(story_ids)
+    finally:
+        db.close()
+
+JOB_HANDLERS = {
+    "process_audio": process_audio_job,
+    "chunk_story": chunk_story_job,
+    "transcode_audio": transcode_audio_job,
+}
+# Jobs whose permanent failure leaves their story unusable; a failed transcode keeps the original
+STORY_FAILING_JOBS = {"process_audio", "chunk_story"}
+
+def claim_job(db, worker_id):
+    now = datetime.utcnow()
+    job = (
+        db.query(Job)
+        .filter(or_(
+            and_(Job.status == "queued", Job.run_after <= now),
+            and_(Job.status == "running", Job.locked_at < now - timedelta(seconds=JOB_LOCK_TIMEOUT)),
+        ))
+        .order_by(Job.run_after, Job.id)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if job is None:
+        db.rollback()
+        return None
+    job.status = "running"
+    job.locked_by = worker_id
+    job.locked_at = now
+    job.attempts += 1
+    db.commit()
+    return job
+
+@contextmanager
+def heartbeat(job_id, worker_id):
+    """Keep refreshing the job's locked_at while the block runs, so a long job
+    (e.g. a segmented transcription) is never mistaken for a dead worker's.
+    Uses its own connection: the job's session belongs to the handler's thread."""
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                with engine.begin() as conn:
+                    conn.execute(
+                        update(Job)
+                        .where(Job.id == job_id, Job.locked_by == worker_id, Job.status == "running")
+                        .values(locked_at=datetime.utcnow())
+                    )
+            except Exception as e:
+                print(f"Job {job_id} heartbeat failed: {e}")
+
+    thread = threading.Thread(target=beat, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+def run_job(db, job):
+    started = time.perf_counter()
+    try:
+        with heartbeat(job.id, job.locked_by):
+            JOB_HANDLERS[job.kind](db, job)
+        job.status = "done"
+        job.last_error = None
+        db.commit()
+        JOB_SECONDS.observe(time.perf_counter() - started, kind=job.kind, outcome="done")
+    except Exception as e:
+        JOB_SECONDS.observe(time.perf_counter() - started, kind=job.kind, outcome="error")
+        db.rollback()
+        job.last_error = str(e)
+        if job.attempts >= job.max_attempts:
+            job.status = "failed"
+            if job.story_id is not None and job.kind in STORY_FAILING_JOBS:
+                db.query(Story).filter(Story.id == job.story_id).update({"status": "failed"})
+            print(f"Job {job.id} ({job.kind}) failed permanently: {e}")
+        else:
+            job.status = "queued"
+            job.run_after = datetime.utcnow() + timedelta(seconds=JOB_RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+            print(f"Job {job.id} ({job.kind}) attempt {job.attempts}/{job.max_attempts} failed, retrying: {e}")
+        db.commit()
+
+def run_once(worker_id):
+    """Claim and run a single job; returns False when the queue is empty"""
+    db = SessionLocal()
+    try:
+        job = claim_job(db, worker_id)
+        if job is None:
+            return False
+        run_job(db, job)
+        return True
+    finally:
+        db.close()
+
+def worker_loop(worker_id, stop_event):
+    while not stop_event.is_set():
+        try:
+            if not run_once(worker_id):
+                stop_event.wait(JOB_POLL_INTERVAL)
+        except Exception as e:
+            print(f"Worker {worker_id} error: {e}")
+            stop_event.wait(JOB_POLL_INTERVAL)
+
+def run_worker(concurrency=WORKER_CONCURRENCY):
+    """Run a pool of worker threads until interrupted"""
+    prefix = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    if METRICS_ENABLED:
+        start_metrics_server(WORKER_METRICS_PORT)
+    stop_event = threading.Event()
+    threads = [
+        threading.Thread(target=worker_loop, args=(f"{prefix}-{i}", stop_event), daemon=True)
+        for i in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    print(f"Worker started with {concurrency} threads ({prefix})")
+
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print("Stopping worker...")
+        stop_event.set()
+        for thread in threads:
+            thread.join()
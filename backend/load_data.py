@@ -1,7 +1,15 @@
 import csv
+import hashlib
 import os
-import shutil
-from database import SessionLocal, Story, Profile
+import time
+from array import array
+from sqlalchemy import insert, update, text
+from database import SessionLocal, Story, StoryChunk, Profile, sync_profile_vector_indexes
+from embeddings import embed_text, embed_texts, embeddings_available, EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY
+from local_embeddings import local_embedding
+from chunks import backfill_chunks
+from prompt_context import summarize
+from storage import import_files
 from openai import OpenAI
 
 def get_openai_client():
@@ -13,65 +21,101 @@ def get_openai_client():
 
 def generate_embedding(text, client):
     """Generate embedding for text"""
-    if client is None:
-        # Fallback: simple hash-based dummy embedding
-        import hashlib
-        import random
-        
-        # Use text hash as seed for consistent embeddings
-        hash_seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
-        random.seed(hash_seed)
-        return [random.random() for _ in range(1536)]
+    if not embeddings_available(client):
+        # Fallback: the same local embedding the API uses, so queries still match
+        return local_embedding(text)
     
     try:
-        response = client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=text
-        )
-        return response.data[0].embedding
+        return embed_text(text, client)
     except Exception as e:
         print(f"Embedding generation failed: {e}")
-        # Fallback to dummy embedding
-        import random
-        return [random.random() for _ in range(1536)]
+        return local_embedding(text)
+
+def generate_embeddings(texts, client, batch_size=EMBEDDING_BATCH_SIZE, concurrency=EMBEDDING_CONCURRENCY):
+    """Generate embeddings for many texts using batched, parallel requests"""
+    embeddings = embed_texts(texts, client, batch_size=batch_size, concurrency=concurrency)
+    # Anything that could not be embedded gets the local hashing embedding
+    return [e if e is not None else generate_embedding(t, None) for t, e in zip(texts, embeddings)]
+
+CSV_PATH = "/app/data/stories.csv"
+# Rows read, embedded and written per transaction by the incremental import
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", "1000"))
+
+def csv_source_key(row):
+    """Stable identity of a CSV row: its `id` column if the file has one, else its title"""
+    return (row.get("id") or "").strip() or (row.get("title") or "").strip() or None
+
+def csv_row_hash(row):
+    content = "\0".join((row.get(field) or "").strip() for field in ("year", "title", "transcript"))
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+def csv_year(row):
+    return int(row['year']) if row.get('year') else None
+
+def create_default_profile(db):
+    profile = Profile(
+        name="Steve Jobs",
+        relation="grandfather",
+        avatar_url="https://upload.wikimedia.org/wikipedia/commons/thumb/d/dc/Steve_Jobs_Headshot_2010-CROP_%28cropped_2%29.jpg/256px-Steve_Jobs_Headshot_2010-CROP_%28cropped_2%29.jpg"
+    )
+    db.add(profile)
+    db.commit()
+    db.refresh(profile)
+    print(f"Created profile: {profile.name} ({profile.relation})")
+    return profile
+
+def default_profile(db):
+    """The profile the sample CSV belongs to, created on first use"""
+    profile = db.query(Profile).filter(Profile.name == "Steve Jobs").order_by(Profile.id).first()
+    return profile if profile is not None else create_default_profile(db)
+
+def iter_csv_batches(csv_path, batch_size=IMPORT_BATCH_SIZE):
+    """Stream (key, hash, row) tuples from a CSV in lists of batch_size; memory stays bounded by one batch"""
+    with open(csv_path, 'r', newline='', encoding='utf-8') as csvfile:
+        batch = []
+        for row in csv.DictReader(csvfile):
+            if not (row.get('transcript') or '').strip():
+                continue
+            batch.append((csv_source_key(row), csv_row_hash(row), row))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
 
 def copy_audio_files():
-    """Copy audio files from data directory to storage"""
+    """Store the sample clips in content-addressed storage; unchanged files are skipped"""
     source_dir = "/app/data/jobs_speech_clips"
-    target_dir = "/app/storage"
-    
-    # Create storage directory if it doesn't exist
-    os.makedirs(target_dir, exist_ok=True)
     
     if not os.path.exists(source_dir):
         print(f"Source audio directory {source_dir} not found")
         return {}
     
+    filenames = sorted(f for f in os.listdir(source_dir) if f.endswith(('.mp3', '.wav', '.m4a')))
+    try:
+        stored = import_files([os.path.join(source_dir, f) for f in filenames])
+    except Exception as e:
+        print(f"Error storing audio files: {e}")
+        return {}
+    
     audio_mapping = {}
-    for filename in os.listdir(source_dir):
-        if filename.endswith(('.mp3', '.wav', '.m4a')):
-            source_path = os.path.join(source_dir, filename)
-            target_path = os.path.join(target_dir, filename)
-            
-            try:
-                shutil.copy2(source_path, target_path)
-                # Map story titles to audio filenames based on content and context
-                if "cancer_story" in filename.lower():
-                    audio_mapping["Cancer Diagnosis"] = filename
-                elif "college_story" in filename.lower():
-                    audio_mapping["Dropping Out of Reed"] = filename  
-                elif "stay_hungry" in filename.lower():
-                    audio_mapping["Introducing the iPhone"] = filename
-                elif "intro" in filename.lower():
-                    audio_mapping["Apple in the Garage"] = filename
-                # Skip jobs_full_raw.mp3 as it's not matched to a specific story
-                print(f"Copied audio file: {filename}")
-            except Exception as e:
-                print(f"Error copying {filename}: {e}")
+    for filename in filenames:
+        audio_path, copied = stored[os.path.join(source_dir, filename)]
+        # Map story titles to audio filenames based on content and context
+        if "cancer_story" in filename.lower():
+            audio_mapping["Cancer Diagnosis"] = audio_path
+        elif "college_story" in filename.lower():
+            audio_mapping["Dropping Out of Reed"] = audio_path
+        elif "stay_hungry" in filename.lower():
+            audio_mapping["Introducing the iPhone"] = audio_path
+        elif "intro" in filename.lower():
+            audio_mapping["Apple in the Garage"] = audio_path
+        # Skip jobs_full_raw.mp3 as it's not matched to a specific story
+        print(f"{'Stored' if copied else 'Unchanged'} audio file: {filename} -> {audio_path}")
     
     return audio_mapping
 
-def load_stories_from_csv(clear_existing=False):
+def load_stories_from_csv(clear_existing=False, batch_size=EMBEDDING_BATCH_SIZE, concurrency=EMBEDDING_CONCURRENCY):
     """Load stories from CSV file and populate database"""
     db = SessionLocal()
     client = get_openai_client()
@@ -94,21 +138,13 @@ def load_stories_from_csv(clear_existing=False):
             print("Cleared existing database data")
         
         # Create Steve Jobs profile
-        steve_jobs_profile = Profile(
-            name="Steve Jobs",
-            relation="grandfather",
-            avatar_url="https://upload.wikimedia.org/wikipedia/commons/thumb/d/dc/Steve_Jobs_Headshot_2010-CROP_%28cropped_2%29.jpg/256px-Steve_Jobs_Headshot_2010-CROP_%28cropped_2%29.jpg"
-        )
-        db.add(steve_jobs_profile)
-        db.commit()
-        db.refresh(steve_jobs_profile)
-        print(f"Created profile: {steve_jobs_profile.name} ({steve_jobs_profile.relation})")
+        steve_jobs_profile = create_default_profile(db)
         
         # Copy audio files and get mapping
         audio_mapping = copy_audio_files()
         
         # Load stories from CSV
-        csv_path = "/app/data/stories.csv"
+        csv_path = CSV_PATH
         if not os.path.exists(csv_path):
             print(f"CSV file {csv_path} not found")
             return
@@ -121,31 +157,23 @@ def load_stories_from_csv(clear_existing=False):
                 if row['transcript'].strip():
                     csv_data.append(row)
         
-        # Create text stories
-        stories_loaded = 0
+        # Text stories (no audio) followed by separate audio-only records
+        story_rows = []
         for row in csv_data:
-            year = int(row['year']) if row['year'] else None
-            title = row['title']
-            transcript = row['transcript']
-            
-            # Generate embedding
-            embedding = generate_embedding(transcript, client)
-            
-            # Create story (text only, no audio)
-            story = Story(
-                profile_id=steve_jobs_profile.id,
-                transcript=transcript,
-                embedding=embedding,
-                event_year=year,
-                audio_path=None
-            )
-            
-            db.add(story)
-            stories_loaded += 1
-            print(f"Loaded text story: {title} ({year})")
+            year = csv_year(row)
+            story_rows.append({
+                "profile_id": steve_jobs_profile.id,
+                "transcript": row['transcript'],
+                "summary": summarize(row['transcript']),
+                "event_year": year,
+                "audio_path": None,
+                # Lets `cli.py import` pick these rows up incrementally later
+                "source_key": csv_source_key(row),
+                "source_hash": csv_row_hash(row)
+            })
+            print(f"Prepared text story: {row['title']} ({year})")
+        stories_loaded = len(story_rows)
         
-        # Create separate audio-only records
-        audio_records_loaded = 0
         for title, audio_filename in audio_mapping.items():
             # Find the corresponding story year from CSV data
             story_year = None
@@ -154,24 +182,33 @@ def load_stories_from_csv(clear_existing=False):
                     story_year = int(row['year']) if row['year'] else None
                     break
             
-            # Create audio-only record with minimal transcript
-            audio_transcript = f"Audio recording: {title}"
-            audio_embedding = generate_embedding(audio_transcript, client)
-            
-            audio_story = Story(
-                profile_id=steve_jobs_profile.id,
-                transcript=audio_transcript,
-                embedding=audio_embedding,
-                event_year=story_year,
-                audio_path=audio_filename
-            )
-            
-            db.add(audio_story)
-            audio_records_loaded += 1
-            print(f"Loaded audio recording: {title} ({story_year}) -> {audio_filename}")
+            # Audio-only record with minimal transcript
+            story_rows.append({
+                "profile_id": steve_jobs_profile.id,
+                "transcript": f"Audio recording: {title}",
+                "summary": summarize(f"Audio recording: {title}"),
+                "event_year": story_year,
+                "audio_path": audio_filename,
+                "source_key": None,
+                "source_hash": None
+            })
+            print(f"Prepared audio recording: {title} ({story_year}) -> {audio_filename}")
+        audio_records_loaded = len(story_rows) - stories_loaded
+        
+        # Embed everything in batches, then insert all rows in one executemany
+        embeddings = generate_embeddings(
+            [row["transcript"] for row in story_rows], client,
+            batch_size=batch_size, concurrency=concurrency
+        )
+        for row, embedding in zip(story_rows, embeddings):
+            row["embedding"] = embedding
+        if story_rows:
+            db.execute(insert(Story), story_rows)
         
         db.commit()
         print(f"Successfully loaded {stories_loaded} text stories and {audio_records_loaded} audio recordings from CSV")
+        sync_profile_vector_indexes()
+        backfill_chunks(client, batch_size=batch_size, concurrency=concurrency)
         
     except Exception as e:
         print(f"Error loading stories: {e}")
@@ -179,5 +216,145 @@ def load_stories_from_csv(clear_existing=False):
     finally:
         db.close()
 
+def import_stories_csv(csv_path=CSV_PATH, profile_id=None, delete_missing=True, batch_size=IMPORT_BATCH_SIZE,
+                       embedding_batch_size=EMBEDDING_BATCH_SIZE, concurrency=EMBEDDING_CONCURRENCY):
+    """Incremental, re-runnable CSV import.
+
+    Rows are matched to stories by source key (the `id` or `title` column)
+    and compared by content hash: new rows are inserted, changed rows are
+    re-embedded and updated (their chunks rebuilt), unchanged rows are
+    skipped, and with delete_missing, imported stories whose row is gone are
+    deleted once the whole file has been read. Stories from an older `load`
+    (no source key) with an identical transcript are adopted rather than
+    duplicated. Returns the counts and per-phase timings.
+    """
+    if not os.path.exists(csv_path):
+        print(f"CSV file {csv_path} not found")
+        return None
+    started = time.perf_counter()
+    counts = {"inserted": 0, "updated": 0, "adopted": 0, "skipped": 0, "deleted": 0}
+    timings = {"read": 0.0, "embed": 0.0, "write": 0.0, "delete": 0.0}
+    # IDs of every story the file still has; 8 bytes per row
+    seen = array('q')
+    db = SessionLocal()
+    client = get_openai_client()
+    
+    try:
+        profile_id = profile_id or default_profile(db).id
+        batches = iter_csv_batches(csv_path, batch_size)
+        while True:
+            phase = time.perf_counter()
+            batch = next(batches, None)
+            timings["read"] += time.perf_counter() - phase
+            if batch is None:
+                break
+            
+            phase = time.perf_counter()
+            # A key repeated in the file: the last row wins
+            rows = {key or f"sha256:{row_hash}": (row_hash, row) for key, row_hash, row in batch}
+            existing = {
+                key: (story_id, source_hash)
+                for story_id, key, source_hash in db.query(Story.id, Story.source_key, Story.source_hash).filter(
+                    Story.profile_id == profile_id, Story.source_key.in_(list(rows))
+                )
+            }
+            unkeyed = [row['transcript'] for key, (_, row) in rows.items() if key not in existing]
+            legacy = {}
+            if unkeyed:
+                for story_id, transcript in db.query(Story.id, Story.transcript).filter(
+                    Story.profile_id == profile_id, Story.source_key.is_(None), Story.transcript.in_(unkeyed)
+                ).order_by(Story.id):
+                    legacy.setdefault(transcript, story_id)
+            
+            inserts, updates, adopted = [], [], []
+            for key, (row_hash, row) in rows.items():
+                if key in existing:
+                    story_id, source_hash = existing[key]
+                    seen.append(story_id)
+                    if source_hash == row_hash:
+                        counts["skipped"] += 1
+                    else:
+                        updates.append((story_id, key, row_hash, row))
+                elif row['transcript'] in legacy:
+                    story_id = legacy.pop(row['transcript'])
+                    seen.append(story_id)
+                    adopted.append({"id": story_id, "source_key": key, "source_hash": row_hash, "event_year": csv_year(row)})
+                else:
+                    inserts.append((key, row_hash, row))
+            timings["read"] += time.perf_counter() - phase
+            
+            phase = time.perf_counter()
+            changed = inserts + [(key, row_hash, row) for _, key, row_hash, row in updates]
+            embeddings = generate_embeddings(
+                [row['transcript'] for _, _, row in changed], client,
+                batch_size=embedding_batch_size, concurrency=concurrency
+            )
+            timings["embed"] += time.perf_counter() - phase
+            
+            phase = time.perf_counter()
+            values = [
+                {
+                    "transcript": row['transcript'],
+                    "summary": summarize(row['transcript']),
+                    "event_year": csv_year(row),
+                    "embedding": embedding,
+                    "source_key": key,
+                    "source_hash": row_hash,
+                    "status": "ready"
+                }
+                for (key, row_hash, row), embedding in zip(changed, embeddings)
+            ]
+            new_values, changed_values = values[:len(inserts)], values[len(inserts):]
+            if new_values:
+                inserted_ids = db.execute(
+                    insert(Story).returning(Story.id, sort_by_parameter_order=True),
+                    [{"profile_id": profile_id, "audio_path": None, **v} for v in new_values]
+                ).scalars().all()
+                seen.extend(inserted_ids)
+            if changed_values:
+                updated_ids = [story_id for story_id, _, _, _ in updates]
+                db.execute(update(Story), [{"id": story_id, **v} for story_id, v in zip(updated_ids, changed_values)])
+                # Rebuilt by backfill_chunks below
+                db.query(StoryChunk).filter(StoryChunk.story_id.in_(updated_ids)).delete(synchronize_session=False)
+            if adopted:
+                db.execute(update(Story), adopted)
+            db.commit()
+            timings["write"] += time.perf_counter() - phase
+            counts["inserted"] += len(inserts)
+            counts["updated"] += len(updates)
+            counts["adopted"] += len(adopted)
+            print(f"  {sum(counts.values()):,} rows: {counts['inserted']} inserted, {counts['updated']} updated, "
+                  f"{counts['adopted']} adopted, {counts['skipped']} unchanged")
+        
+        if delete_missing:
+            phase = time.perf_counter()
+            # Only after the whole file was read: a failed run never deletes anything
+            result = db.execute(text(
+                "DELETE FROM stories WHERE profile_id = :profile_id AND source_key IS NOT NULL AND NOT (id = ANY(:ids))"
+            ), {"profile_id": profile_id, "ids": list(seen)})
+            db.commit()
+            counts["deleted"] = result.rowcount
+            timings["delete"] += time.perf_counter() - phase
+    except Exception as e:
+        print(f"Error importing stories: {e}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+    
+    if counts["inserted"] or counts["updated"]:
+        sync_profile_vector_indexes()
+        backfill_chunks(client, batch_size=embedding_batch_size, concurrency=concurrency)
+    
+    total = time.perf_counter() - started
+    rows = counts["inserted"] + counts["updated"] + counts["adopted"] + counts["skipped"]
+    print(
+        f"Imported {csv_path} into profile {profile_id}: {counts['inserted']} inserted, {counts['updated']} updated, "
+        f"{counts['adopted']} adopted, {counts['skipped']} unchanged, {counts['deleted']} deleted "
+        f"in {total:.1f}s ({rows / total:,.0f} rows/s; read {timings['read']:.1f}s, embed {timings['embed']:.1f}s, "
+        f"write {timings['write']:.1f}s, delete {timings['delete']:.1f}s)"
+    )
+    return {**counts, "seconds": {**{k: round(v, 3) for k, v in timings.items()}, "total": round(total, 3)}}
+
 if __name__ == "__main__":
     load_stories_from_csv()
\ No newline at end of file
@@ -0,0 +1,58 @@
+"""
+Deterministic local embeddings by feature hashing.
+
+Each lowercased word and adjacent word pair is hashed (blake2b, so the same
+text gives the same vector in every process) to one of EMBEDDING_DIM
+buckets with a +/- sign, weighted 1 + log(count) and L2-normalized. Texts
+that share words get a positive cosine similarity, so retrieval over these
+vectors behaves like keyword matching. A batch is scattered into one NumPy
+matrix; there is no shared state beyond a thread-safe token hash cache.
+
+Used for every embedding with EMBEDDING_BACKEND=local, and as the fallback
+for stories and queries when OpenAI is unavailable.
+"""
+import hashlib
+import math
+import re
+from collections import Counter
+from functools import lru_cache
+
+import numpy as np
+
+from database import EMBEDDING_DIM
+
+LOCAL_EMBEDDING_MODEL = "local-hash-v1"
+BIGRAM_WEIGHT = 0.5
+TOKEN_PATTERN = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+
+@lru_cache(maxsize=65536)
+def _bucket(feature):
+    """(index, sign) of a feature; the top bit of the hash picks the sign"""
+    h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+    return h % EMBEDDING_DIM, 1.0 if h >> 63 else -1.0
+
+def features(text):
+    words = TOKEN_PATTERN.findall((text or "").lower())
+    counts = Counter(words)
+    weights = {w: 1 + math.log(n) for w, n in counts.items()}
+    for pair, n in Counter(f"{a} {b}" for a, b in zip(words, words[1:])).items():
+        weights[pair] = BIGRAM_WEIGHT * (1 + math.log(n))
+    return weights
+
+def local_embeddings(texts):
+    """float32 matrix with one unit-length row per text (all zeros for a text with no words)"""
+    rows, columns, values = [], [], []
+    for row, text in enumerate(texts):
+        for feature, weight in features(text).items():
+            index, sign = _bucket(feature)
+            rows.append(row)
+            columns.append(index)
+            values.append(sign * weight)
+    matrix = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    np.add.at(matrix, (np.array(rows, dtype=np.intp), np.array(columns, dtype=np.intp)), np.array(values, dtype=np.float32))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    np.divide(matrix, norms, out=matrix, where=norms > 0)
+    return matrix
+
+def local_embedding(text):
+    return local_embeddings([text])[0].tolist()
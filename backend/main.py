@@ -1,15 +1,33 @@
+import asyncio
+import json
+import mimetypes
 import os
-import uuid
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form
+import time
+from email.utils import formatdate
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form, BackgroundTasks, Request, Response, Query
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import text
-from openai import OpenAI
-from typing import Optional
+from sqlalchemy import text, select, func, and_, or_
+from sqlalchemy.engine import Connection
+from openai import AsyncOpenAI
+from typing import Literal, Optional, Union
 
-from database import get_db, create_tables, Story, Profile
-from models import StoryResponse, ChatQuery, ChatResponse, ProfileCreate, ProfileResponse
+from database import get_db, get_read_db, pool_stats, create_tables, missing_tables, create_profile_vector_indexes, Story, StoryChunk, Profile
+from embeddings import aembed_text, embedding_cache
+from local_embeddings import local_embedding
+from jobs import enqueue_job, latest_job
+from chunks import needs_chunks
+from retrieval import search_stories, search_batch
+from vector_store import vector_store, VECTOR_BACKEND
+from response_cache import response_cache, response_key
+from prompt_context import build_context, summarize
+from transcode import TRANSCODE_ON_INGEST
+from metrics import stage, openai_call, STAGE_SECONDS, fallback, record_prompt, register_collector, start_snapshots, render as render_metrics, METRICS_ENABLED, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from pagination import decode_cursor, make_etag, etag_matches, page, TIMELINE_MAX_PAGE_SIZE
+from storage import save_upload, storage_path, is_content_addressed, parse_range, iter_file, MAX_UPLOAD_BYTES
+from models import StoryResponse, StorySummaryResponse, StoryChunkResponse, StoryStatusResponse, WaveformResponse, ChatQuery, ChatResponse, BatchChatQuery, BatchChatAnswer, BatchChatProfileResult, BatchChatResponse, ProfileCreate, ProfileResponse
 
 app = FastAPI(title="Bardo Timeline & Voice Recall API")
 
@@ -19,32 +37,126 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor"],
 )
 
-app.mount("/audio", StaticFiles(directory="/app/storage"), name="audio")
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    # Refuse before the multipart body is spooled to disk when the client declares its size
+    if request.method == "POST" and request.url.path == "/stories":
+        content_length = request.headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES + 1024 * 1024:
+            return JSONResponse(status_code=413, content={"detail": f"Upload exceeds {MAX_UPLOAD_BYTES} bytes"})
+    return await call_next(request)
+
+_openai_client = None
 
 def get_openai_client():
-    try:
-        return OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
-    except Exception as e:
-        print(f"OpenAI client initialization error: {e}")
-        return None
+    """Shared AsyncOpenAI client so every request reuses one connection pool"""
+    global _openai_client
+    if _openai_client is None:
+        try:
+            _openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        except Exception as e:
+            print(f"OpenAI client initialization error: {e}")
+            return None
+    return _openai_client
+
+def find_transcript_for_audio(db: Session, profile_id: int, audio_filename: str, sha256: str):
+    """Whisper's transcript of an earlier upload of the same recording to this profile, if any.
+    Matches on the upload's digest too, since transcoding replaces the stored file. Typed
+    and fallback transcripts are never reused: they describe the story, not the audio."""
+    row = db.query(Story.transcript).filter(
+        Story.profile_id == profile_id,
+        or_(Story.audio_path == audio_filename, Story.source_sha256 == sha256),
+        Story.transcript_source == "whisper", Story.transcript.isnot(None), Story.status == "ready"
+    ).first()
+    return row[0] if row else None
+
+STORY_RESPONSE_COLUMNS = (
+    Story.id, Story.profile_id, Story.transcript, Story.audio_path,
+    Story.event_year, Story.status, Story.created_at,
+)
+STORY_EXCERPT_CHARS = int(os.getenv("STORY_EXCERPT_CHARS", "200"))
+# Timeline cards: no transcript, just its opening words (cut in the database)
+STORY_SUMMARY_COLUMNS = (
+    Story.id, Story.profile_id, Story.audio_path, Story.event_year, Story.status, Story.created_at,
+    func.left(Story.transcript, STORY_EXCERPT_CHARS).label("excerpt"),
+)
+
+def not_modified(request: Request, response: Response, etag: str):
+    """Set the validator headers; True if the client's copy is current"""
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "no-cache"
+    return etag_matches(request.headers.get("if-none-match"), etag)
+
+def after_story(event_year, story_id):
+    """Stories after (event_year, id) in timeline order; undated stories sort last"""
+    if event_year is None:
+        return and_(Story.event_year.is_(None), Story.id > story_id)
+    return or_(
+        Story.event_year > event_year,
+        and_(Story.event_year == event_year, Story.id > story_id),
+        Story.event_year.is_(None),
+    )
+
+def find_profile(db: Session, profile_id: int):
+    return db.query(Profile).filter(Profile.id == profile_id).first()
+
+def save_with_jobs(db: Session, story, jobs: list):
+    """Insert a story and the (kind, payload) jobs that will finish it in one transaction"""
+    db.add(story)
+    db.flush()
+    for kind, payload in jobs:
+        enqueue_job(db, kind, story_id=story.id, payload=payload)
+    db.commit()
+    db.refresh(story)
+    return story
+
+def add_to_vector_store(db: Session, story):
+    """Make a new story searchable in the in-process vector store without a rebuild"""
+    version = db.query(Profile.timeline_version).filter(Profile.id == story.profile_id).scalar()
+    vector_store.add(story.profile_id, version, story.id, story.embedding, story.event_year)
+
+# Schema setup is `python cli.py migrate`, run once per deploy; opt in here for a single dev process
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "false").lower() == "true"
 
 @app.on_event("startup")
 async def startup_event():
-    create_tables()
+    if MIGRATE_ON_STARTUP:
+        create_tables()
+    # Multi-worker serve: share this worker's metrics with whichever one answers /metrics
+    start_snapshots()
 
 @app.get("/")
 async def root():
     return {"message": "Bardo Timeline & Voice Recall API"}
 
 @app.get("/profiles", response_model=list[ProfileResponse])
-async def get_profiles(db: Session = Depends(get_db)):
-    profiles = db.query(Profile).all()
-    return profiles
+def get_profiles(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=TIMELINE_MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    conn: Connection = Depends(get_read_db)
+):
+    # Profiles are only ever added, so their count and highest id identify the list
+    count, max_id = conn.execute(select(func.count(Profile.id), func.max(Profile.id))).one()
+    if not_modified(request, response, make_etag("profiles", count, max_id, limit, after)):
+        return Response(status_code=304, headers=dict(response.headers))
+    
+    query = select(Profile.__table__).order_by(Profile.id)
+    if after:
+        query = query.where(Profile.id > decode_cursor(after, ("id",))[0])
+    if limit:
+        query = query.limit(limit + 1)
+    rows, next_cursor = page(conn.execute(query).mappings().all(), limit, lambda row: (row["id"],))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return rows
 
 @app.post("/profiles", response_model=ProfileResponse)
-async def create_profile(profile: ProfileCreate, db: Session = Depends(get_db)):
+def create_profile(profile: ProfileCreate, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
     db_profile = Profile(
         name=profile.name,
         relation=profile.relation,
@@ -53,23 +165,57 @@ async def create_profile(profile: ProfileCreate, db: Session = Depends(get_db)):
     db.add(db_profile)
     db.commit()
     db.refresh(db_profile)
+    background_tasks.add_task(create_profile_vector_indexes, db_profile.id)
     return db_profile
 
 @app.get("/profiles/{profile_id}", response_model=ProfileResponse)
-async def get_profile(profile_id: int, db: Session = Depends(get_db)):
-    profile = db.query(Profile).filter(Profile.id == profile_id).first()
+def get_profile(profile_id: int, conn: Connection = Depends(get_read_db)):
+    profile = conn.execute(select(Profile.__table__).where(Profile.id == profile_id)).mappings().first()
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     return profile
 
-@app.get("/profiles/{profile_id}/stories", response_model=list[StoryResponse])
-async def get_profile_stories(profile_id: int, db: Session = Depends(get_db)):
-    profile = db.query(Profile).filter(Profile.id == profile_id).first()
+@app.get("/profiles/{profile_id}/stories", response_model=Union[list[StoryResponse], list[StorySummaryResponse]])
+def get_profile_stories(
+    profile_id: int,
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=TIMELINE_MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fields: Literal["full", "summary"] = "full",
+    conn: Connection = Depends(get_read_db)
+):
+    """Stories in timeline order (event_year, then id).
+
+    Pass `limit` to page; the next page's `after` cursor comes back in the
+    X-Next-Cursor header. `fields=summary` drops transcripts for an excerpt.
+    The ETag follows profiles.timeline_version, so a 304 costs one primary
+    key lookup.
+    """
+    profile = conn.execute(select(Profile.__table__).where(Profile.id == profile_id)).mappings().first()
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
+    etag = make_etag("stories", profile_id, profile["timeline_version"], limit, after, fields)
+    if not_modified(request, response, etag):
+        return Response(status_code=304, headers=dict(response.headers))
     
-    stories = db.query(Story).filter(Story.profile_id == profile_id).order_by(Story.event_year.asc()).all()
-    return stories
+    # Explicit columns: never ship the 1536-dim embedding over the wire just to drop it
+    columns = STORY_SUMMARY_COLUMNS if fields == "summary" else STORY_RESPONSE_COLUMNS
+    query = (
+        select(*columns)
+        .where(Story.profile_id == profile_id)
+        .order_by(Story.event_year.asc(), Story.id.asc())
+    )
+    if after:
+        query = query.where(after_story(*decode_cursor(after, ("year", "id"))))
+    if limit:
+        query = query.limit(limit + 1)
+    rows, next_cursor = page(conn.execute(query).mappings().all(), limit, lambda row: (row["event_year"], row["id"]))
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if fields == "summary":
+        return rows
+    return [{**row, "profile": profile} for row in rows]
 
 @app.post("/stories", response_model=StoryResponse)
 async def create_story(
@@ -79,85 +225,219 @@ async def create_story(
     audio: Optional[UploadFile] = File(None),
     db: Session = Depends(get_db)
 ):
+    # Verify profile exists before doing any expensive work
+    with stage("create_story", "profile_lookup"):
+        profile = await run_in_threadpool(find_profile, db, profile_id)
+    if not profile:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    
     final_transcript = transcript
-    audio_path = None
+    transcript_source = "user" if transcript else None
+    audio_filename = None
+    audio_sha256 = None
+    client = get_openai_client()
     
     if audio:
-        audio_filename = f"{uuid.uuid4()}.{audio.filename.split('.')[-1]}"
-        audio_path = f"/app/storage/{audio_filename}"
+        with stage("create_story", "upload"):
+            audio_filename, audio_sha256, _, _ = await save_upload(audio)
         
-        with open(audio_path, "wb") as audio_file:
-            content = await audio.read()
-            audio_file.write(content)
+        if not final_transcript:
+            # Same recording uploaded before: reuse its transcript instead of re-running Whisper
+            with stage("create_story", "dedupe_lookup"):
+                final_transcript = await run_in_threadpool(
+                    find_transcript_for_audio, db, profile_id, audio_filename, audio_sha256
+                )
+            transcript_source = "whisper" if final_transcript else None
         
         if not final_transcript:
-            try:
-                client = get_openai_client()
-                if client is None:
-                    raise Exception("OpenAI client not available")
-                with open(audio_path, "rb") as audio_file:
-                    transcription = client.audio.transcriptions.create(
-                        model="whisper-1",
-                        file=audio_file
-                    )
-                final_transcript = transcription.text
-            except Exception as e:
-                # Fallback: use filename as transcript for demo purposes
-                final_transcript = f"Audio file: {audio.filename}"
+            # Transcription and embedding happen in the worker (`python cli.py worker`)
+            story = Story(
+                profile_id=profile_id,
+                transcript=None,
+                audio_path=audio_filename,
+                source_sha256=audio_sha256,
+                event_year=event_year,
+                status="pending"
+            )
+            # process_audio enqueues the transcode itself, once Whisper is done with the original
+            with stage("create_story", "save"):
+                story = await run_in_threadpool(
+                    save_with_jobs, db, story, [("process_audio", {"original_filename": audio.filename})]
+                )
+            return story
     
     if not final_transcript:
         raise HTTPException(status_code=400, detail="Either transcript or audio must be provided")
     
     try:
-        client = get_openai_client()
-        if client is None:
-            raise Exception("OpenAI client not available")
-        embedding_response = client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=final_transcript
-        )
-        embedding = embedding_response.data[0].embedding
+        with stage("create_story", "embed"):
+            embedding = await aembed_text(final_transcript, client)
     except Exception as e:
-        # Fallback: use dummy embedding for demo purposes
-        import random
-        embedding = [random.random() for _ in range(1536)]
-    
-    # Verify profile exists
-    profile = db.query(Profile).filter(Profile.id == profile_id).first()
-    if not profile:
-        raise HTTPException(status_code=404, detail="Profile not found")
+        # Fallback: local hashing embedding, the same one queries fall back to
+        fallback("local_embedding")
+        embedding = await run_in_threadpool(local_embedding, final_transcript)
     
     story = Story(
         profile_id=profile_id,
         transcript=final_transcript,
-        audio_path=audio_filename if audio_path else None,
+        transcript_source=transcript_source,
+        summary=summarize(final_transcript),
+        audio_path=audio_filename,
+        source_sha256=audio_sha256,
         embedding=embedding,
         event_year=event_year
     )
     
-    db.add(story)
-    db.commit()
-    db.refresh(story)
-    
+    jobs = []
+    if needs_chunks(final_transcript):
+        # Searchable right away through the whole-story embedding; chunks follow from the worker
+        jobs.append(("chunk_story", {}))
+    if audio_filename and TRANSCODE_ON_INGEST:
+        jobs.append(("transcode_audio", {}))
+    with stage("create_story", "save"):
+        story = await run_in_threadpool(save_with_jobs, db, story, jobs)
+    if VECTOR_BACKEND == "memory":
+        await run_in_threadpool(add_to_vector_store, db, story)
     return story
 
-def generate_conversational_response(query: str, relevant_stories: list, profile, client):
-    """Generate a conversational response using OpenAI chat"""
-    if not client or not profile:
-        name = profile.name if profile else "the person"
-        return f"Hey there! I've found {len(relevant_stories)} memories from {name} that relate to what you're asking about. Let me share them with you."
+# Transcoded formats, in case the system MIME table lacks them
+mimetypes.add_type("audio/ogg", ".ogg")
+mimetypes.add_type("audio/mp4", ".m4a")
+
+@app.api_route("/audio/{path:path}", methods=["GET", "HEAD"])
+def get_audio(path: str, request: Request):
+    """Stored audio with single-range requests (seeking) and validator/cache headers"""
+    file_path = storage_path(path)
+    if file_path is None or not os.path.isfile(file_path):
+        raise HTTPException(status_code=404, detail="Audio not found")
+    stat = os.stat(file_path)
     
+    if is_content_addressed(path):
+        # The name is the content hash: cache forever
+        etag = f'"{os.path.basename(path).split(".")[0]}"'
+        cache_control = "public, max-age=31536000, immutable"
+    else:
+        etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+        cache_control = "public, max-age=3600"
+    headers = {
+        "Accept-Ranges": "bytes",
+        "ETag": etag,
+        "Cache-Control": cache_control,
+        "Last-Modified": formatdate(stat.st_mtime, usegmt=True),
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    
+    # If-Range: only honour the range when the client's copy is still this file
+    if_range = request.headers.get("if-range")
+    byte_range = None if if_range and if_range != etag else parse_range(request.headers.get("range"), stat.st_size)
+    start, end = byte_range or (0, stat.st_size - 1)
+    status_code = 206 if byte_range else 200
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat.st_size}"
+    headers["Content-Length"] = str(end - start + 1)
+    media_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=media_type)
+    return StreamingResponse(iter_file(file_path, start, end), status_code=status_code, headers=headers, media_type=media_type)
+
+@app.get("/stories/{story_id}/waveform", response_model=WaveformResponse)
+def get_story_waveform(story_id: int, conn: Connection = Depends(get_read_db)):
+    """Peak data for the player, available once the transcode job has run"""
+    row = conn.execute(
+        select(Story.id.label("story_id"), Story.duration_ms, Story.waveform.label("peaks"))
+        .where(Story.id == story_id)
+    ).mappings().first()
+    if not row:
+        raise HTTPException(status_code=404, detail="Story not found")
+    if row["peaks"] is None:
+        raise HTTPException(status_code=404, detail="Waveform not generated yet")
+    return row
+
+@app.get("/stories/{story_id}/status", response_model=StoryStatusResponse)
+def get_story_status(story_id: int, db: Session = Depends(get_db)):
+    story = db.query(Story).filter(Story.id == story_id).first()
+    if not story:
+        raise HTTPException(status_code=404, detail="Story not found")
+    
+    job = latest_job(db, story_id)
+    return StoryStatusResponse(
+        story_id=story.id,
+        status=story.status,
+        job_status=job.status if job else None,
+        attempts=job.attempts if job else 0,
+        last_error=job.last_error if job else None
+    )
+
+@app.get("/stories/{story_id}/chunks", response_model=list[StoryChunkResponse])
+def get_story_chunks(story_id: int, conn: Connection = Depends(get_read_db)):
+    """Timestamped segments of a long recording, in order"""
+    columns = [c for c in StoryChunk.__table__.c if c.name not in ("embedding", "profile_id", "created_at")]
+    return conn.execute(
+        select(*columns).where(StoryChunk.story_id == story_id).order_by(StoryChunk.chunk_index)
+    ).mappings().all()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the worker process is serving requests; never touches the database"""
+    return {"status": "ok", "pid": os.getpid()}
+
+@app.get("/readyz")
+def readyz():
+    """Readiness: the database answers and `migrate` has created the schema; 503 otherwise"""
     try:
-        # Build context from relevant stories
-        context = f"Here are some relevant memories from {profile.name}:\n\n"
-        for i, story in enumerate(relevant_stories, 1):
-            year = f" ({story.event_year})" if story.event_year else ""
-            context += f"{i}. {story.transcript}{year}\n\n"
-        
-        # Create a conversational prompt based on the profile
-        relation_context = f"You are {profile.name}, the {profile.relation} of the person you're talking to."
-        
-        system_prompt = f"""You are {profile.name}, speaking from beyond as a digital echo of your memories and stories. 
+        missing = missing_tables()
+    except Exception as e:
+        return JSONResponse(status_code=503, content={"status": "unavailable", "pid": os.getpid(), "detail": str(e)})
+    if missing:
+        return JSONResponse(status_code=503, content={
+            "status": "unavailable", "pid": os.getpid(), "detail": f"missing tables {missing}; run `python cli.py migrate`"
+        })
+    return {"status": "ready", "pid": os.getpid()}
+
+@app.get("/stats/db-pool")
+async def db_pool_stats():
+    return pool_stats()
+
+@app.get("/stats/embedding-cache")
+async def embedding_cache_stats():
+    return embedding_cache.stats()
+
+@app.get("/stats/chat-cache")
+async def chat_cache_stats():
+    return response_cache.stats()
+
+@app.get("/stats/vector-store")
+async def vector_store_stats():
+    return {"backend": VECTOR_BACKEND, **vector_store.stats()}
+
+if METRICS_ENABLED:
+    register_collector("bardo_db_pool", pool_stats)
+    register_collector("bardo_embedding_cache", embedding_cache.stats)
+    register_collector("bardo_chat_cache", response_cache.stats)
+    if VECTOR_BACKEND == "memory":
+        register_collector("bardo_vector_store", vector_store.stats)
+    
+    @app.get("/metrics")
+    def metrics():
+        """Prometheus scrape endpoint; only registered with METRICS_ENABLED=true"""
+        return Response(render_metrics(), headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+def fallback_response(relevant_stories: list, profile=None):
+    if profile is None:
+        return f"Hey there! I found {len(relevant_stories)} memories that relate to what you're asking about. Let me share them with you."
+    return f"Hey there! I've found {len(relevant_stories)} memories from {profile.name} that relate to what you're asking about. Let me share them with you."
+
+def build_chat_messages(query: str, relevant_stories: list, profile):
+    """Persona system prompt plus the retrieved stories as context, within PROMPT_CONTEXT_TOKENS.
+
+    Returns (messages, report); the report says how much the budget trimmed.
+    """
+    context, report = build_context(f"Here are some relevant memories from {profile.name}:\n\n", relevant_stories)
+    record_prompt(report)
+    
+    system_prompt = f"""You are {profile.name}, speaking from beyond as a digital echo of your memories and stories. 
         You are talking to someone who is exploring the stories and memories you left behind. You are their {profile.relation}.
         
         Respond authentically as {profile.name} would, with the warmth and love appropriate for a {profile.relation}. You should:
@@ -171,90 +451,269 @@ def generate_conversational_response(query: str, relevant_stories: list, profile
         - Use appropriate terms of endearment based on your relationship as their {profile.relation}
         
         Keep responses warm but concise, speaking as the {profile.relation} they are connecting with through these memories."""
+    
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": f"Context: {context}\n\nUser question: {query}"}
+    ], report
+
+async def generate_conversational_response(query: str, relevant_stories: list, profile, client, report: dict = None):
+    """Generate a conversational response using OpenAI chat.
+
+    `report`, if given, is filled with the prompt context report and the generation time.
+    """
+    if not client or not profile:
+        fallback("chat_response")
+        name = profile.name if profile else "the person"
+        return f"Hey there! I've found {len(relevant_stories)} memories from {name} that relate to what you're asking about. Let me share them with you."
+    
+    key = response_key(profile.id, profile.timeline_version, query, [story.id for story in relevant_stories])
+    cached = response_cache.get(key)
+    if cached is not None:
+        if report is not None:
+            report["cached"] = True
+        return cached
+    
+    messages, context_report = build_chat_messages(query, relevant_stories, profile)
+    if report is not None:
+        report.update(context_report)
+    try:
+        started = time.perf_counter()
+        with openai_call("chat"):
+            response = await client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=messages,
+                max_tokens=300,
+                temperature=0.7
+            )
         
-        messages = [
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": f"Context: {context}\n\nUser question: {query}"}
-        ]
-        
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=messages,
-            max_tokens=300,
-            temperature=0.7
-        )
-        
-        return response.choices[0].message.content.strip()
+        message = response.choices[0].message.content.strip()
+        generation_ms = (time.perf_counter() - started) * 1000
+        response_cache.put(key, message, generation_ms)
+        if report is not None:
+            report["generation_ms"] = round(generation_ms, 1)
+        return message
         
     except Exception as e:
         print(f"Conversational response generation failed: {e}")
-        return f"Hey there! I found {len(relevant_stories)} memories that relate to what you're asking about. Let me share them with you."
+        fallback("chat_response")
+        return fallback_response(relevant_stories)
 
-@app.post("/chat", response_model=dict)
-async def chat_query(query: ChatQuery, db: Session = Depends(get_db)):
+async def stream_conversational_response(query: str, relevant_stories: list, profile, client, report: dict = None):
+    """Yield the persona response piece by piece as the model produces it"""
+    if not client or not profile:
+        fallback("chat_response")
+        yield fallback_response(relevant_stories, profile)
+        return
+    
+    key = response_key(profile.id, profile.timeline_version, query, [story.id for story in relevant_stories])
+    cached = response_cache.get(key)
+    if cached is not None:
+        if report is not None:
+            report["cached"] = True
+        yield cached
+        return
+    
+    messages, context_report = build_chat_messages(query, relevant_stories, profile)
+    if report is not None:
+        report.update(context_report)
+    sent_any = False
+    fragments = []
+    try:
+        started = time.perf_counter()
+        # Time until the response starts streaming; token time shows in the stage histogram
+        with openai_call("chat_stream"):
+            stream = await client.chat.completions.create(
+                model="gpt-3.5-turbo",
+                messages=messages,
+                max_tokens=300,
+                temperature=0.7,
+                stream=True
+            )
+        async for chunk in stream:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                sent_any = True
+                fragments.append(delta)
+                yield delta
+        # Only complete responses are cached; /chat and /chat/stream share entries
+        if fragments:
+            response_cache.put(key, "".join(fragments).strip(), (time.perf_counter() - started) * 1000)
+    except Exception as e:
+        print(f"Conversational response streaming failed: {e}")
+        fallback("chat_response")
+        if not sent_any:
+            yield fallback_response(relevant_stories)
+
+async def embed_query(text: str, client):
+    """Embed a question; local hashing embedding if OpenAI fails, so stories stored the same way still match"""
+    try:
+        return await aembed_text(text, client)
+    except Exception as e:
+        fallback("local_query_embedding")
+        return local_embedding(text)
+
+async def retrieve_for_chat(query: ChatQuery, db: Session, client, endpoint: str = "chat"):
+    """Profile lookup, query embedding and story search shared by both /chat variants"""
     # Get the profile
-    profile = db.query(Profile).filter(Profile.id == query.profile_id).first()
+    with stage(endpoint, "profile_lookup"):
+        profile = await run_in_threadpool(find_profile, db, query.profile_id)
     if not profile:
         raise HTTPException(status_code=404, detail="Profile not found")
     
+    with stage(endpoint, "embed"):
+        query_embedding = await embed_query(query.query, client)
+    
+    # Query only stories from this profile
+    with stage(endpoint, "search"):
+        stories = await run_in_threadpool(
+            search_stories, db, query.profile_id, query_embedding, query.ef_search, query.probes,
+            query_text=query.query, profile_version=profile.timeline_version
+        )
+    return profile, stories
+
+def profile_response(profile):
+    return ProfileResponse(
+        id=profile.id,
+        name=profile.name,
+        relation=profile.relation,
+        avatar_url=profile.avatar_url,
+        created_at=profile.created_at
+    )
+
+@app.post("/chat", response_model=dict)
+async def chat_query(query: ChatQuery, db: Session = Depends(get_db)):
     client = get_openai_client()
+    profile, stories = await retrieve_for_chat(query, db, client)
     
-    try:
-        if client is None:
-            raise Exception("OpenAI client not available")
-        embedding_response = client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=query.query
+    # Generate conversational response
+    context_report = {}
+    with stage("chat", "generate"):
+        conversational_response = await generate_conversational_response(
+            query.query, stories, profile, client, context_report
         )
-        query_embedding = embedding_response.data[0].embedding
-    except Exception as e:
-        # Fallback: use dummy embedding for demo purposes
-        import hashlib
-        import random
+    
+    return {
+        "message": conversational_response,
+        "stories": stories,
+        "profile": profile_response(profile),
+        "context": context_report
+    }
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(query: ChatQuery, db: Session = Depends(get_db)):
+    """Server-Sent Events variant of /chat.
+
+    Emits one `stories` event with the retrieved stories and profile, then a
+    `token` event per response fragment, then a `done` event carrying
+    time-to-first-byte, time-to-first-token and total latency in milliseconds.
+    """
+    started = time.perf_counter()
+    client = get_openai_client()
+    # Retrieval runs before streaming starts so a missing profile is still a plain 404
+    profile, stories = await retrieve_for_chat(query, db, client, endpoint="chat_stream")
+    
+    def elapsed_ms():
+        return round((time.perf_counter() - started) * 1000, 1)
+    
+    async def events():
+        timings = {}
+        yield sse_event("stories", {
+            "stories": [story.model_dump(mode="json") for story in stories],
+            "profile": profile_response(profile).model_dump(mode="json")
+        })
+        timings["ttfb_ms"] = elapsed_ms()
         
-        # Use query hash as seed for consistent embeddings
-        hash_seed = int(hashlib.md5(query.query.encode()).hexdigest()[:8], 16)
-        random.seed(hash_seed)
-        query_embedding = [random.random() for _ in range(1536)]
+        context_report = {}
+        with stage("chat_stream", "generate"):
+            async for fragment in stream_conversational_response(query.query, stories, profile, client, context_report):
+                if "first_token_ms" not in timings:
+                    timings["first_token_ms"] = elapsed_ms()
+                yield sse_event("token", {"text": fragment})
+        
+        timings["total_ms"] = elapsed_ms()
+        # Milestones since the request started, next to the per-stage spans (context tokens go through record_prompt)
+        STAGE_SECONDS.observe(timings["ttfb_ms"] / 1000, endpoint="chat_stream", stage="ttfb")
+        if "first_token_ms" in timings:
+            STAGE_SECONDS.observe(timings["first_token_ms"] / 1000, endpoint="chat_stream", stage="first_token")
+        yield sse_event("done", {**timings, "context": context_report})
     
-    # Query only stories from this profile
-    sql_query = text("""
-        SELECT 
-            id, profile_id, transcript, audio_path, event_year, created_at,
-            1 - (embedding <=> :query_embedding) as similarity_score
-        FROM stories 
-        WHERE profile_id = :profile_id
-        ORDER BY embedding <=> :query_embedding
-        LIMIT 5
-    """)
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+BATCH_CHAT_MAX_QUERIES = int(os.getenv("BATCH_CHAT_MAX_QUERIES", "10"))
+BATCH_CHAT_MAX_PROFILES = int(os.getenv("BATCH_CHAT_MAX_PROFILES", "20"))
+# Persona responses generated at once per batch request
+BATCH_CHAT_CONCURRENCY = int(os.getenv("BATCH_CHAT_CONCURRENCY", "8"))
+
+@app.post("/chat/batch", response_model=BatchChatResponse)
+async def chat_batch(query: BatchChatQuery, db: Session = Depends(get_db)):
+    """Ask one or more questions of several profiles at once.
+
+    Each distinct question is embedded once, and one SQL statement returns
+    the top `limit` stories of every profile for every question. Results are
+    grouped by profile, in the order of `profile_ids`.
+    """
+    queries = list(dict.fromkeys(q for q in ([query.query] if query.query else []) + query.queries if q.strip()))
+    profile_ids = list(dict.fromkeys(query.profile_ids))
+    if not queries:
+        raise HTTPException(status_code=400, detail="Provide query or queries")
+    if not profile_ids:
+        raise HTTPException(status_code=400, detail="Provide at least one profile_id")
+    if len(queries) > BATCH_CHAT_MAX_QUERIES or len(profile_ids) > BATCH_CHAT_MAX_PROFILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {BATCH_CHAT_MAX_QUERIES} queries and {BATCH_CHAT_MAX_PROFILES} profiles per request"
+        )
+    client = get_openai_client()
     
-    result = db.execute(sql_query, {"query_embedding": str(query_embedding), "profile_id": query.profile_id})
-    rows = result.fetchall()
+    with stage("chat_batch", "profile_lookup"):
+        profiles = await run_in_threadpool(
+            lambda: {p.id: p for p in db.query(Profile).filter(Profile.id.in_(profile_ids))}
+        )
+    missing = [profile_id for profile_id in profile_ids if profile_id not in profiles]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Profiles not found: {missing}")
     
-    stories = []
-    for row in rows:
-        story_dict = {
-            'id': row[0],
-            'profile_id': row[1],
-            'transcript': row[2],
-            'audio_path': row[3],
-            'event_year': row[4],
-            'created_at': row[5],
-            'similarity_score': row[6]
-        }
-        stories.append(StoryResponse(**story_dict))
+    with stage("chat_batch", "embed"):
+        embeddings = await asyncio.gather(*(embed_query(q, client) for q in queries))
     
-    # Generate conversational response
-    conversational_response = generate_conversational_response(query.query, stories, profile, client)
+    with stage("chat_batch", "search"):
+        hits = await run_in_threadpool(
+            search_batch, db, profile_ids, embeddings, queries, query.limit, query.ef_search, query.probes,
+            {profile_id: profile.timeline_version for profile_id, profile in profiles.items()}
+        )
     
-    return {
-        "message": conversational_response,
-        "stories": stories,
-        "profile": ProfileResponse(
-            id=profile.id,
-            name=profile.name,
-            relation=profile.relation,
-            avatar_url=profile.avatar_url,
-            created_at=profile.created_at
+    messages, reports = {}, {}
+    if query.respond:
+        semaphore = asyncio.Semaphore(BATCH_CHAT_CONCURRENCY)
+        
+        async def respond(profile_id, i):
+            async with semaphore:
+                report = reports[(profile_id, i)] = {}
+                messages[(profile_id, i)] = await generate_conversational_response(
+                    queries[i], hits[(profile_id, i)], profiles[profile_id], client, report
+                )
+        
+        with stage("chat_batch", "generate"):
+            await asyncio.gather(*(respond(profile_id, i) for profile_id, i in hits))
+    
+    return BatchChatResponse(results=[
+        BatchChatProfileResult(
+            profile=profile_response(profiles[profile_id]),
+            answers=[
+                BatchChatAnswer(
+                    query=q, message=messages.get((profile_id, i)), stories=hits[(profile_id, i)],
+                    context=reports.get((profile_id, i))
+                )
+                for i, q in enumerate(queries)
+            ]
         )
-    }
\ No newline at end of file
+        for profile_id in profile_ids
+    ])
@@ -0,0 +1,319 @@
+"""
+Latency histograms and counters in Prometheus text format.
+
+A small in-process registry rather than a client library: counters and
+histograms keyed by label values, rendered on scrape by the API's /metrics
+endpoint (or `start_metrics_server` in the worker). With METRICS_ENABLED
+off, `stage`/`timed` hand back a shared no-op context manager and
+`inc`/`observe` return before touching a lock, so instrumented code pays
+one attribute check.
+
+Under `cli.py serve` with several workers, METRICS_MULTIPROC_DIR is set:
+each process writes a snapshot of its series there every
+METRICS_FLUSH_SECONDS (and on exit), and whichever worker answers a scrape
+renders counters and histograms summed over every snapshot. Gauges from
+registered collectors are per process, labelled with its pid.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "false").lower() == "true"
+# Seconds; covers a 5 ms cache hit up to a minute-long transcription
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+METRICS_FLUSH_SECONDS = float(os.getenv("METRICS_FLUSH_SECONDS", "5"))
+
+_NOOP = nullcontext()
+_registry = []
+_collectors = []
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _format_value(value):
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(total, values):
+        for key, value in values.items():
+            total[key] = total.get(key, 0) + value
+
+    def render(self, values=None):
+        values = self.snapshot() if values is None else values
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, seconds, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(labels.get(n, "") for n in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += seconds
+            series[-1] += 1
+
+    def time(self, **labels):
+        """Context manager observing the duration of its block"""
+        if not METRICS_ENABLED:
+            return _NOOP
+        return _Timer(self, labels)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: list(series) for key, series in self._series.items()}
+
+    @staticmethod
+    def merge(total, values):
+        for key, series in values.items():
+            if key in total:
+                total[key] = [a + b for a, b in zip(total[key], series)]
+            else:
+                total[key] = list(series)
+
+    def render(self, values=None):
+        values = self.snapshot() if values is None else values
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for key, series in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [f'le="{bound}"'])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key, ['le="+Inf"'])
+            lines.append(f"{self.name}_bucket{labels} {series[-1]}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{labels} {series[-1]}")
+        return lines
+
+class _Timer:
+    __slots__ = ("histogram", "labels", "started")
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, **self.labels)
+        return False
+
+STAGE_SECONDS = Histogram(
+    "bardo_stage_duration_seconds", "Time spent in each stage of an endpoint", ("endpoint", "stage")
+)
+OPENAI_SECONDS = Histogram(
+    "bardo_openai_request_duration_seconds", "OpenAI API call latency", ("operation", "outcome")
+)
+DB_SECONDS = Histogram(
+    "bardo_db_query_duration_seconds", "Database statement latency by statement type", ("statement",)
+)
+JOB_SECONDS = Histogram(
+    "bardo_job_duration_seconds", "Background job run time", ("kind", "outcome")
+)
+PROMPT_CONTEXT_TOKENS = Histogram(
+    "bardo_prompt_context_tokens", "Estimated tokens of story context per persona prompt", (),
+    buckets=(100, 250, 500, 750, 1000, 1500, 2000, 3000, 4000, 8000)
+)
+PROMPT_TOKENS_SAVED = Counter(
+    "bardo_prompt_tokens_saved_total", "Context tokens removed by the prompt budget (summaries, dropped stories)"
+)
+FALLBACKS = Counter(
+    "bardo_fallback_total", "Degraded code paths taken (local embedding, filename transcript, ...)", ("kind",)
+)
+
+def stage(endpoint, name):
+    """Timing span for one stage of a request: `with stage("chat", "embed"): ...`"""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _Timer(STAGE_SECONDS, {"endpoint": endpoint, "stage": name})
+
+def openai_call(operation):
+    """Span for an OpenAI request; records whether it raised"""
+    if not METRICS_ENABLED:
+        return _NOOP
+    return _OpenAITimer(operation)
+
+class _OpenAITimer:
+    __slots__ = ("operation", "started")
+
+    def __init__(self, operation):
+        self.operation = operation
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        OPENAI_SECONDS.observe(
+            time.perf_counter() - self.started, operation=self.operation, outcome="error" if exc_type else "ok"
+        )
+        return False
+
+def fallback(kind):
+    FALLBACKS.inc(kind=kind)
+
+def record_prompt(report):
+    """Observe a prompt_context.build_context report"""
+    PROMPT_CONTEXT_TOKENS.observe(report["context_tokens"])
+    PROMPT_TOKENS_SAVED.inc(report["saved_tokens"])
+
+def register_collector(prefix, stats):
+    """Export a stats() dict's numeric values as gauges named <prefix>_<key> at scrape time"""
+    _collectors.append((prefix, stats))
+
+def collect_gauges():
+    """[(name, value)] from the registered collectors"""
+    gauges = []
+    for prefix, stats in _collectors:
+        try:
+            values = stats()
+        except Exception as e:
+            print(f"Metrics collector {prefix} failed: {e}")
+            continue
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                gauges.append((f"{prefix}_{key}", value))
+    return gauges
+
+def snapshot_path(pid=None):
+    return os.path.join(METRICS_MULTIPROC_DIR, f"metrics-{pid or os.getpid()}.json")
+
+def write_snapshot():
+    """This process's series and gauges, written atomically for the other workers to read"""
+    data = {
+        "written": time.time(),
+        "series": {metric.name: [[list(k), v] for k, v in metric.snapshot().items()] for metric in _registry},
+        "gauges": collect_gauges(),
+    }
+    path = snapshot_path()
+    temp = f"{path}.tmp"
+    with open(temp, "w") as f:
+        json.dump(data, f)
+    os.replace(temp, path)
+
+def _flush_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_SECONDS)
+        try:
+            write_snapshot()
+        except Exception as e:
+            print(f"Metrics snapshot failed: {e}")
+
+def start_snapshots():
+    """Snapshot this process's metrics periodically and on exit (METRICS_MULTIPROC_DIR only)"""
+    if not (METRICS_ENABLED and METRICS_MULTIPROC_DIR):
+        return
+    os.makedirs(METRICS_MULTIPROC_DIR, exist_ok=True)
+    write_snapshot()
+    atexit.register(write_snapshot)
+    threading.Thread(target=_flush_loop, daemon=True).start()
+
+def _render_multiprocess():
+    write_snapshot()
+    totals = {metric.name: {} for metric in _registry}
+    gauges = []
+    # A worker that exited keeps counting toward the totals; its gauges are only current while it runs
+    live_after = time.time() - 3 * METRICS_FLUSH_SECONDS
+    for path in sorted(glob.glob(os.path.join(METRICS_MULTIPROC_DIR, "metrics-*.json"))):
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            continue
+        for metric in _registry:
+            values = {tuple(k): v for k, v in data["series"].get(metric.name, [])}
+            metric.merge(totals[metric.name], values)
+        if data["written"] >= live_after:
+            pid = os.path.basename(path)[len("metrics-"):-len(".json")]
+            gauges.extend((name, value, pid) for name, value in data["gauges"])
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render(totals[metric.name]))
+    for name in sorted({name for name, _, _ in gauges}):
+        lines.append(f"# TYPE {name} gauge")
+        lines.extend(
+            f'{name}{{pid="{pid}"}} {_format_value(value)}' for gauge, value, pid in gauges if gauge == name
+        )
+    return lines
+
+def render():
+    if METRICS_MULTIPROC_DIR:
+        return "\n".join(_render_multiprocess()) + "\n"
+    lines = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    for name, value in collect_gauges():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        body = render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port):
+    """Serve render() on a background thread, for processes without the API (the worker)"""
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    print(f"Metrics on :{port}/metrics")
+    return server
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional
 from datetime import datetime
 
@@ -25,19 +25,83 @@ class StoryCreate(BaseModel):
 class StoryResponse(BaseModel):
     id: int
     profile_id: int
-    transcript: str
+    transcript: Optional[str]  # None while an audio upload is still being transcribed
     audio_path: Optional[str]
     event_year: Optional[int]
+    status: str = "ready"
     created_at: datetime
     similarity_score: Optional[float] = None
     profile: Optional[ProfileResponse] = None
+    # Prompt context only; never part of a response
+    summary: Optional[str] = Field(None, exclude=True)
 
     class Config:
         from_attributes = True
 
+class StorySummaryResponse(BaseModel):
+    """Timeline card: a story without its transcript"""
+    id: int
+    profile_id: int
+    audio_path: Optional[str]
+    event_year: Optional[int]
+    status: str = "ready"
+    created_at: datetime
+    excerpt: Optional[str]
+
+class StoryChunkResponse(BaseModel):
+    id: int
+    story_id: int
+    chunk_index: int
+    text: str
+    start_ms: Optional[int]
+    end_ms: Optional[int]
+    audio_path: Optional[str]
+
+    class Config:
+        from_attributes = True
+
+class StoryStatusResponse(BaseModel):
+    story_id: int
+    status: str
+    job_status: Optional[str] = None
+    attempts: int = 0
+    last_error: Optional[str] = None
+
+class WaveformResponse(BaseModel):
+    story_id: int
+    duration_ms: Optional[int]
+    peaks: list[float]
+
 class ChatQuery(BaseModel):
     query: str
     profile_id: int
+    # Optional ANN tuning: higher values trade latency for recall (pgvector caps ef_search at 1000)
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1)
+
+class BatchChatQuery(BaseModel):
+    """One question (`query`) or several (`queries`) asked of every profile in `profile_ids`"""
+    query: Optional[str] = None
+    queries: list[str] = []
+    profile_ids: list[int]
+    limit: int = Field(5, ge=1, le=20)
+    # False returns only the retrieved stories, skipping one model call per (profile, question)
+    respond: bool = True
+    ef_search: Optional[int] = Field(None, ge=1, le=1000)
+    probes: Optional[int] = Field(None, ge=1)
+
+class BatchChatAnswer(BaseModel):
+    query: str
+    message: Optional[str] = None
+    stories: list[StoryResponse]
+    context: Optional[dict] = None
+
+class BatchChatProfileResult(BaseModel):
+    profile: ProfileResponse
+    answers: list[BatchChatAnswer]
+
+class BatchChatResponse(BaseModel):
+    results: list[BatchChatProfileResult]
 
 class ChatResponse(BaseModel):
     stories: list[StoryResponse]
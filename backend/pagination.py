@@ -0,0 +1,61 @@
+"""
+Keyset pagination cursors and ETags for the list endpoints.
+
+Cursors are opaque (base64url JSON of the last row's sort key), so clients
+only ever pass back what `X-Next-Cursor` gave them. ETags are weak and built
+from a version the caller can read without scanning the listed rows.
+"""
+import base64
+import hashlib
+import json
+import os
+from datetime import datetime
+from fastapi import HTTPException
+
+TIMELINE_MAX_PAGE_SIZE = int(os.getenv("TIMELINE_MAX_PAGE_SIZE", "500"))
+
+def encode_cursor(*key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode("utf-8")).decode("ascii").rstrip("=")
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def _cursor_value(value, kind):
+    """One sort key value checked against its kind: "id", "year" (nullable) or "timestamp" (ISO 8601)"""
+    if kind == "id" and _is_int(value):
+        return value
+    if kind == "year" and (value is None or _is_int(value)):
+        return value
+    if kind == "timestamp" and isinstance(value, str):
+        return datetime.fromisoformat(value)
+    raise ValueError(f"Expected {kind}, got {value!r}")
+
+def decode_cursor(cursor, kinds):
+    """Sort key tuple with one value per entry of `kinds`; 400 for anything we did not issue"""
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        if not isinstance(key, list) or len(key) != len(kinds):
+            raise ValueError("Wrong cursor length")
+        return tuple(_cursor_value(value, kind) for value, kind in zip(key, kinds))
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def make_etag(*parts):
+    digest = hashlib.sha256("\0".join(str(p) for p in parts).encode("utf-8")).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison: W/"x" and "x" are the same validator
+    tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag.removeprefix("W/") in tags
+
+def page(rows, limit, key):
+    """Trim a `limit + 1` result to `limit` rows; returns (rows, next_cursor or None)"""
+    if limit is None or len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(*key(rows[-1]))
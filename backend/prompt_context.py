@@ -0,0 +1,146 @@
+"""
+Token-budgeted story context for the persona prompt.
+
+Every story carries a short extractive summary, computed once when its
+transcript is stored (`stories.summary`). The prompt context starts from the
+summaries of all retrieved stories, then upgrades stories to their full
+transcript in rank order while PROMPT_CONTEXT_TOKENS allows. Stories that
+do not fit even as a summary are dropped from the bottom of the ranking.
+Tokens are estimated locally with the same heuristic as embedding batching.
+"""
+import os
+import re
+from collections import Counter
+
+from database import SessionLocal, Story
+from embeddings import estimate_tokens
+
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "1500"))
+STORY_SUMMARY_TOKENS = int(os.getenv("STORY_SUMMARY_TOKENS", "120"))
+BACKFILL_PAGE_SIZE = 500
+
+SENTENCE_SPLIT = re.compile(r"(?<=[.!?])\s+")
+WORD = re.compile(r"[^\W_]+(?:'[^\W_]+)*")
+# Too common to say what a sentence is about
+STOPWORDS = frozenset("""
+a about after all also an and any are as at be because been but by can could did do does for from had has have
+he her him his how i if in into is it its just me more my no not now of on one or our out she so some than that
+the their them then there they this to too up us very was we were what when where which who will with would you
+your i'm it's don't can't
+""".split())
+
+def summarize(transcript, max_tokens=STORY_SUMMARY_TOKENS):
+    """Extractive summary: the transcript's most central sentences, in their original order.
+
+    A sentence scores by how often its content words recur across the whole
+    transcript (normalized by length); the first sentence gets a boost since
+    spoken stories usually open by setting the scene.
+    """
+    transcript = (transcript or "").strip()
+    if estimate_tokens(transcript) <= max_tokens:
+        return transcript
+    sentences = [s for s in SENTENCE_SPLIT.split(transcript) if s]
+    frequencies = Counter(w for w in WORD.findall(transcript.lower()) if w not in STOPWORDS)
+
+    def score(i, sentence):
+        words = [w for w in WORD.findall(sentence.lower()) if w not in STOPWORDS]
+        value = sum(frequencies[w] for w in words) / (len(words) + 1)
+        return value * (1.5 if i == 0 else 1.0)
+
+    ranked = sorted(range(len(sentences)), key=lambda i: score(i, sentences[i]), reverse=True)
+    chosen, used = [], 0
+    for i in ranked:
+        cost = estimate_tokens(sentences[i])
+        if used + cost > max_tokens:
+            continue
+        chosen.append(i)
+        used += cost
+    if not chosen:
+        # A single sentence longer than the budget: cut it at a word boundary
+        return trim_to_tokens(sentences[ranked[0]], max_tokens)
+    return " ".join(sentences[i] for i in sorted(chosen))
+
+def trim_to_tokens(text, max_tokens):
+    limit = max(max_tokens - 1, 0) * 4
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(" ", 1)[0] + "…"
+
+def story_line(i, text, event_year):
+    year = f" ({event_year})" if event_year else ""
+    return f"{i}. {text}{year}\n\n"
+
+def build_context(header, stories, budget=PROMPT_CONTEXT_TOKENS):
+    """Context text for the prompt plus a report of what the budget did.
+
+    `stories` are ranked best first and need `transcript`, `event_year` and
+    (optionally) `summary`. Returns (context, report).
+    """
+    entries = []
+    for story in stories:
+        full = story.transcript or ""
+        summary = getattr(story, "summary", None) or summarize(full)
+        if estimate_tokens(summary) >= estimate_tokens(full):
+            summary = full
+        entries.append({"story": story, "full": full, "summary": summary, "text": summary})
+
+    untrimmed = estimate_tokens(header) + sum(
+        estimate_tokens(story_line(i, e["full"], e["story"].event_year)) for i, e in enumerate(entries, 1)
+    )
+
+    def cost(kept):
+        return estimate_tokens(header) + sum(
+            estimate_tokens(story_line(i, e["text"], e["story"].event_year)) for i, e in enumerate(kept, 1)
+        )
+
+    # Summaries first; drop the weakest matches until they fit
+    kept = list(entries)
+    while kept and cost(kept) > budget:
+        kept.pop()
+    # Then spend what is left on full transcripts, best match first
+    for entry in kept:
+        if entry["text"] is entry["full"]:
+            continue
+        entry["text"] = entry["full"]
+        if cost(kept) > budget:
+            entry["text"] = entry["summary"]
+
+    context = header + "".join(story_line(i, e["text"], e["story"].event_year) for i, e in enumerate(kept, 1))
+    context_tokens = estimate_tokens(context)
+    report = {
+        "budget_tokens": budget,
+        "context_tokens": context_tokens,
+        "untrimmed_tokens": untrimmed,
+        "saved_tokens": max(untrimmed - context_tokens, 0),
+        "full_stories": sum(1 for e in kept if e["text"] is e["full"]),
+        "summarized_stories": sum(1 for e in kept if e["text"] is not e["full"]),
+        "dropped_stories": len(entries) - len(kept),
+    }
+    return context, report
+
+def backfill_summaries():
+    """Summarize every story with a transcript but no summary (existing data, bulk loads)"""
+    db = SessionLocal()
+    total = 0
+    try:
+        while True:
+            stories = (
+                db.query(Story)
+                .filter(Story.summary.is_(None), Story.transcript.isnot(None))
+                .order_by(Story.id)
+                .limit(BACKFILL_PAGE_SIZE)
+                .all()
+            )
+            if not stories:
+                break
+            for story in stories:
+                story.summary = summarize(story.transcript)
+            db.commit()
+            total += len(stories)
+            print(f"Summarized {total} stories")
+    except Exception as e:
+        print(f"Error summarizing stories: {e}")
+        db.rollback()
+    finally:
+        db.close()
+    return total
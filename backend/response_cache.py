@@ -0,0 +1,106 @@
+"""
+In-process cache of persona chat completions.
+
+Responses are keyed by profile, its timeline_version, the normalized
+question and the IDs of the stories retrieved for it. Any change to the
+profile's stories (an upload, the worker finishing a transcription, a CSV
+import) bumps timeline_version in the database, so older answers are never
+served again, by this process or any other, without explicit invalidation.
+Entries expire after CHAT_CACHE_TTL seconds and the least recently used one
+is evicted past CHAT_CACHE_SIZE; entries of superseded versions are dropped
+as soon as a newer one is stored.
+"""
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+CHAT_CACHE_SIZE = int(os.getenv("CHAT_CACHE_SIZE", "1024"))  # 0 disables the cache
+CHAT_CACHE_TTL = float(os.getenv("CHAT_CACHE_TTL", "3600"))
+
+def normalize_query(query):
+    """Case, punctuation and whitespace do not change the answer"""
+    return " ".join(re.sub(r"[^\w\s]", " ", query.lower()).split())
+
+def response_key(profile_id, timeline_version, query, story_ids):
+    ids = ",".join(str(i) for i in sorted(story_ids))
+    digest = hashlib.sha256(f"{normalize_query(query)}\0{ids}".encode("utf-8")).hexdigest()
+    return (profile_id, timeline_version, digest)
+
+class ResponseCache:
+    """TTL + LRU map of response_key -> (message, expires_at, generation_ms)"""
+
+    def __init__(self, max_entries=CHAT_CACHE_SIZE, ttl=CHAT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._versions = {}  # profile_id -> newest timeline_version stored
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.latency_saved_ms = 0.0
+
+    def get(self, key):
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.latency_saved_ms += entry[2]
+            return entry[0]
+
+    def put(self, key, message, generation_ms):
+        """Store a response along with how long the model took to produce it"""
+        if self.max_entries <= 0:
+            return
+        profile_id, version = key[0], key[1]
+        with self._lock:
+            if version < self._versions.get(profile_id, version):
+                # Generated from a timeline that has since changed
+                return
+            if version > self._versions.get(profile_id, version):
+                self._drop_profile(profile_id, version)
+            self._versions[profile_id] = version
+            self._entries[key] = (message, time.monotonic() + self.ttl, generation_ms)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def _drop_profile(self, profile_id, version):
+        """Remove the profile's entries older than `version`; caller holds the lock"""
+        stale = [key for key in self._entries if key[0] == profile_id and key[1] < version]
+        for key in stale:
+            del self._entries[key]
+        self.invalidations += len(stale)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "latency_saved_ms": round(self.latency_saved_ms, 1),
+            }
+
+response_cache = ResponseCache()
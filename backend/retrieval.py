@@ -0,0 +1,323 @@
+"""
+Story retrieval for /chat.
+
+One SQL statement per query: vector candidates (chunk max-sim or whole-story),
+full-text candidates from the `transcript_tsv` GIN index, and an optional
+event_year range parsed from the question, merged with reciprocal rank fusion.
+With VECTOR_BACKEND=memory, ranking is vector-only and done in process by
+vector_store; Postgres just returns the winning rows by primary key.
+/chat/batch runs the same statement once per (profile, query) pair, UNION ALL'd.
+"""
+import os
+import re
+from sqlalchemy import text
+
+from database import set_search_params, query_vector_sql, index_order_sql, Profile, EMBEDDING_STORAGE, BINARY_RERANK_FACTOR, PROFILE_VECTOR_INDEXES, HNSW_MAX_EF_SEARCH
+from models import StoryResponse
+from vector_store import vector_store, VECTOR_BACKEND
+
+# "chunks": rank stories by their best-matching chunk (max-sim); "stories": whole-story vectors only
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "chunks").lower()
+CHUNK_CANDIDATES = int(os.getenv("CHUNK_CANDIDATES", "50"))
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "true").lower() == "true"
+TEXT_CANDIDATES = int(os.getenv("TEXT_CANDIDATES", "50"))
+# Standard RRF damping constant: score = sum(1 / (RRF_K + rank))
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+YEAR = r"((?:19|20)\d{2})"
+YEAR_RANGE_PATTERNS = [
+    # between 1980 and 1985 / from 1980 to 1985 / 1980-1985 / 1980 to 1985
+    (re.compile(rf"\b(?:between\s+|from\s+)?{YEAR}\s*(?:-|–|to|and|until|through)\s*{YEAR}\b", re.I),
+     lambda m: (int(m.group(1)), int(m.group(2)))),
+    # the 1980s / the 80s / '80s; a bare "80s" is usually an age ("in your 80s"), not a decade
+    (re.compile(r"\b(?:the\s+)?((?:19|20)\d0)'?s\b", re.I), lambda m: (int(m.group(1)), int(m.group(1)) + 9)),
+    (re.compile(r"(?:\bthe\s+'?|(?<!\w)')([5-9]0)'?s\b", re.I), lambda m: (1900 + int(m.group(1)), 1909 + int(m.group(1)))),
+    (re.compile(rf"\bbefore\s+{YEAR}\b", re.I), lambda m: (None, int(m.group(1)) - 1)),
+    (re.compile(rf"\b(?:after|since)\s+{YEAR}\b", re.I), lambda m: (int(m.group(1)) + (0 if "since" in m.group(0).lower() else 1), None)),
+    (re.compile(rf"\b(?:in\s+)?{YEAR}\b", re.I), lambda m: (int(m.group(1)), int(m.group(1)))),
+]
+
+def parse_year_range(query_text):
+    """Extract an event_year range from a question.
+
+    Returns (year_from, year_to, remaining_text); either bound may be None.
+    Only the first match is used: "What happened in 1985?" -> (1985, 1985, "What happened ?").
+
+    >>> parse_year_range("Tell me about the 80s")[:2]
+    (1980, 1989)
+    >>> parse_year_range("Music from the '60s")[:2]
+    (1960, 1969)
+    >>> parse_year_range("What did you do in your 50s?")[:2]
+    (None, None)
+    >>> parse_year_range("when he was in his 60s")[:2]
+    (None, None)
+    >>> parse_year_range("Her 70s and their 80s")[:2]
+    (None, None)
+    """
+    for pattern, to_range in YEAR_RANGE_PATTERNS:
+        match = pattern.search(query_text)
+        if match:
+            year_from, year_to = to_range(match)
+            if year_from and year_to and year_from > year_to:
+                year_from, year_to = year_to, year_from
+            remaining = (query_text[:match.start()] + query_text[match.end():]).strip()
+            return year_from, year_to, remaining
+    return None, None, query_text
+
+def year_clause(alias, year_from, year_to, suffix=""):
+    conditions = []
+    if year_from is not None:
+        conditions.append(f"{alias}event_year >= :year_from{suffix}")
+    if year_to is not None:
+        conditions.append(f"{alias}event_year <= :year_to{suffix}")
+    return "".join(f" AND {c}" for c in conditions)
+
+def nearest_sql(columns, table, where, storage=None, param="query_embedding"):
+    """`columns, distance` of the :candidates rows of <table> nearest the :<param> vector.
+
+    With binary storage the index orders by Hamming distance on the quantized
+    vectors, and a :shortlist of rows is re-ranked by exact cosine distance.
+    """
+    storage = storage or EMBEDDING_STORAGE
+    distance = f"embedding <=> {query_vector_sql(storage, param)}"
+    if storage != "binary":
+        return f"""
+        SELECT {columns}, {distance} AS distance
+        FROM {table}
+        WHERE {where}
+        ORDER BY {distance}
+        LIMIT :candidates"""
+    return f"""
+        SELECT * FROM (
+            SELECT {columns}, {distance} AS distance
+            FROM {table}
+            WHERE {where}
+            ORDER BY {index_order_sql(storage, param)}
+            LIMIT :shortlist
+        ) shortlist
+        ORDER BY distance
+        LIMIT :candidates"""
+
+def vector_candidates_sql(mode, years, profile=":profile_id", suffix=""):
+    """(story_id, distance) rows, nearest first; one row per story"""
+    param = f"query_embedding{suffix}"
+    story_branch = nearest_sql(
+        "id AS story_id", "stories", f"profile_id = {profile} AND status = 'ready'{years}", param=param
+    )
+    if mode != "chunks":
+        return story_branch
+
+    # Chunks carry no event_year; restrict them through their story when filtering
+    chunk_filter = (
+        f" AND story_id IN (SELECT id FROM stories WHERE profile_id = {profile}{years})" if years else ""
+    )
+    return f"""
+        SELECT story_id, MIN(distance) AS distance FROM (
+            ({nearest_sql("story_id", "story_chunks", f"profile_id = {profile} AND embedding IS NOT NULL{chunk_filter}", param=param)})
+            UNION ALL
+            ({story_branch})
+        ) candidates
+        GROUP BY story_id"""
+
+def search_sql(mode, hybrid, year_from, year_to, profile=":profile_id", suffix=""):
+    """The /chat ranking as SQL text. `profile` is the profile filter (the
+    :profile_id parameter, or an inlined id for batches) and `suffix` names
+    this query's own parameters (:query_embedding<suffix>, :query_text<suffix>, ...)."""
+    years = year_clause("", year_from, year_to, suffix)
+    vector_hits = f"""
+        vector_hits AS (
+            SELECT story_id, ROW_NUMBER() OVER (ORDER BY distance) AS rank
+            FROM ({vector_candidates_sql(mode, years, profile, suffix)}) v
+        )"""
+    if not hybrid:
+        ranked = f"WITH {vector_hits}"
+        fused = "SELECT story_id, 1.0 / (:rrf_k + rank) AS score FROM vector_hits"
+    else:
+        # OR the query terms together; plainto_tsquery alone would require every word
+        ranked = f"""WITH {vector_hits},
+        text_query AS (
+            SELECT to_tsquery('english', replace(plainto_tsquery('english', :query_text{suffix})::text, ' & ', ' | ')) AS q
+        ),
+        text_hits AS (
+            SELECT s.id AS story_id,
+                   ROW_NUMBER() OVER (ORDER BY ts_rank_cd(s.transcript_tsv, tq.q) DESC) AS rank
+            FROM stories s, text_query tq
+            WHERE s.profile_id = {profile} AND s.status = 'ready'
+              AND s.transcript_tsv @@ tq.q{year_clause("s.", year_from, year_to, suffix)}
+            ORDER BY ts_rank_cd(s.transcript_tsv, tq.q) DESC
+            LIMIT :text_candidates
+        )"""
+        fused = """
+            SELECT story_id, SUM(1.0 / (:rrf_k + rank)) AS score
+            FROM (SELECT story_id, rank FROM vector_hits UNION ALL SELECT story_id, rank FROM text_hits) hits
+            GROUP BY story_id"""
+
+    return f"""
+        {ranked}
+        SELECT
+            s.id, s.profile_id, s.transcript, s.audio_path, s.event_year, s.created_at,
+            1 - (s.embedding <=> {query_vector_sql(param=f"query_embedding{suffix}")}) as similarity_score, s.summary,
+            fused.score
+        FROM ({fused}) fused JOIN stories s ON s.id = fused.story_id
+        WHERE s.status = 'ready'
+        ORDER BY fused.score DESC, s.id
+        LIMIT :limit
+    """
+
+def build_search_sql(mode, hybrid, year_from, year_to):
+    return text(search_sql(mode, hybrid, year_from, year_to))
+
+def build_batch_search_sql(mode, branches):
+    """search_stories' ranking for many (profile, query) pairs in one statement.
+
+    branches holds (profile_id, query_index, year_from, year_to, hybrid)
+    tuples. Profile ids are inlined as integer literals so each branch can use
+    that profile's partial vector index, exactly like a single /chat search.
+    """
+    parts = [
+        f"""
+        (SELECT {int(query_index)} AS query_index, hit.* FROM ({search_sql(
+            mode, hybrid, year_from, year_to, profile=str(int(profile_id)), suffix=f"_{int(query_index)}"
+        )}) hit)"""
+        for profile_id, query_index, year_from, year_to, hybrid in branches
+    ]
+    return text(f"""
+        SELECT * FROM ({" UNION ALL".join(parts)}
+        ) hits
+        ORDER BY profile_id, query_index, score DESC, id
+    """)
+
+def search_batch(db, profile_ids, query_embeddings, query_texts, limit=5, ef_search=None, probes=None,
+                 profile_versions=None, mode=None):
+    """Top stories for every (profile, query) pair: {(profile_id, query_index): [StoryResponse]}.
+
+    Same ranking as search_stories (chunk max-sim, full-text fusion, year
+    filters), one statement for the whole batch. Pairs whose year filter
+    matched nothing are retried unfiltered in a second statement.
+    """
+    mode = mode or RETRIEVAL_MODE
+    parsed = [parse_year_range(q) for q in query_texts]
+    if VECTOR_BACKEND == "memory":
+        versions = profile_versions or {}
+        return {
+            (profile_id, i): search_memory(db, profile_id, embedding, limit, year_from, year_to, versions.get(profile_id))
+            for profile_id in profile_ids
+            for i, (embedding, (year_from, year_to, _)) in enumerate(zip(query_embeddings, parsed))
+        }
+
+    shortlist = CHUNK_CANDIDATES * (BINARY_RERANK_FACTOR if EMBEDDING_STORAGE == "binary" else 1)
+    ef = max(ef_search or 0, shortlist)
+    if not PROFILE_VECTOR_INDEXES:
+        # Every branch walks the one global index, where the batch's profiles compete for the ef_search rows
+        ef = min(ef * len(profile_ids), HNSW_MAX_EF_SEARCH)
+    set_search_params(db, ef_search=ef, probes=probes)
+    params = {
+        "limit": limit,
+        "candidates": CHUNK_CANDIDATES,
+        "shortlist": shortlist,
+        "text_candidates": TEXT_CANDIDATES,
+        "rrf_k": RRF_K,
+    }
+    for i, (embedding, (year_from, year_to, remaining_text)) in enumerate(zip(query_embeddings, parsed)):
+        params.update({
+            f"query_embedding_{i}": str(embedding),
+            f"query_text_{i}": remaining_text,
+            f"year_from_{i}": year_from,
+            f"year_to_{i}": year_to,
+        })
+    hybrid = [HYBRID_SEARCH and bool(remaining_text.strip()) for _, _, remaining_text in parsed]
+
+    def run(branches, pairs):
+        for row in db.execute(build_batch_search_sql(mode, branches), params).fetchall():
+            pairs[(row[2], row[0])].append(StoryResponse(
+                id=row[1], profile_id=row[2], transcript=row[3], audio_path=row[4],
+                event_year=row[5], created_at=row[6], similarity_score=row[7], summary=row[8]
+            ))
+
+    results = {(profile_id, i): [] for profile_id in profile_ids for i in range(len(query_texts))}
+    run([
+        (profile_id, i, parsed[i][0], parsed[i][1], hybrid[i]) for profile_id, i in results
+    ], results)
+    empty = [key for key, stories in results.items() if not stories and parsed[key[1]][:2] != (None, None)]
+    if empty:
+        # Years that match nothing are dropped, as in search_stories
+        run([(profile_id, i, None, None, hybrid[i]) for profile_id, i in empty], results)
+    return results
+
+def search_memory(db, profile_id, query_embedding, limit, year_from, year_to, profile_version=None):
+    """search_stories for VECTOR_BACKEND=memory: rank in process, then load the rows by ID"""
+    if profile_version is None:
+        profile_version = db.query(Profile.timeline_version).filter(Profile.id == profile_id).scalar()
+    vectors = vector_store.get(db, profile_id, profile_version) if profile_version is not None else None
+    if vectors is None:
+        return []
+    hits = vectors.search(query_embedding, limit, year_from, year_to)
+    if not hits and (year_from is not None or year_to is not None):
+        hits = vectors.search(query_embedding, limit)
+    if not hits:
+        return []
+
+    rows = db.execute(text("""
+        SELECT id, profile_id, transcript, audio_path, event_year, created_at, summary
+        FROM stories WHERE id = ANY(:ids) AND status = 'ready'
+    """), {"ids": [story_id for story_id, _ in hits]}).fetchall()
+    by_id = {row[0]: row for row in rows}
+    return [
+        StoryResponse(
+            id=row[0], profile_id=row[1], transcript=row[2], audio_path=row[3],
+            event_year=row[4], created_at=row[5], similarity_score=similarity, summary=row[6]
+        )
+        for story_id, similarity in hits
+        if (row := by_id.get(story_id)) is not None
+    ]
+
+def search_stories(db, profile_id, query_embedding, ef_search=None, probes=None,
+                   mode=None, limit=5, query_text=None, hybrid=None, profile_version=None):
+    """Top stories of one profile for a query, as StoryResponse objects.
+
+    With query_text, years mentioned in it become an event_year filter and
+    (if hybrid) full-text matches are fused with the vector ranking. A year
+    filter that matches nothing is dropped rather than returning no stories.
+    profile_version (the profile's timeline_version, if the caller has it)
+    saves the memory backend a lookup.
+    """
+    mode = mode or RETRIEVAL_MODE
+    hybrid = HYBRID_SEARCH if hybrid is None else hybrid
+    year_from, year_to, remaining_text = parse_year_range(query_text) if query_text else (None, None, "")
+    if VECTOR_BACKEND == "memory":
+        return search_memory(db, profile_id, query_embedding, limit, year_from, year_to, profile_version)
+    hybrid = hybrid and bool(remaining_text.strip())
+
+    shortlist = CHUNK_CANDIDATES * (BINARY_RERANK_FACTOR if EMBEDDING_STORAGE == "binary" else 1)
+    # HNSW returns at most ef_search rows per scan
+    set_search_params(db, ef_search=max(ef_search or 0, shortlist), probes=probes)
+    params = {
+        "query_embedding": str(query_embedding),
+        "profile_id": profile_id,
+        "limit": limit,
+        "candidates": CHUNK_CANDIDATES,
+        "shortlist": shortlist,
+        "text_candidates": TEXT_CANDIDATES,
+        "rrf_k": RRF_K,
+        "query_text": remaining_text,
+        "year_from": year_from,
+        "year_to": year_to,
+    }
+    rows = db.execute(build_search_sql(mode, hybrid, year_from, year_to), params).fetchall()
+    if not rows and (year_from is not None or year_to is not None):
+        rows = db.execute(build_search_sql(mode, hybrid, None, None), params).fetchall()
+
+    stories = []
+    for row in rows:
+        story_dict = {
+            'id': row[0],
+            'profile_id': row[1],
+            'transcript': row[2],
+            'audio_path': row[3],
+            'event_year': row[4],
+            'created_at': row[5],
+            'similarity_score': row[6],
+            'summary': row[7]
+        }
+        stories.append(StoryResponse(**story_dict))
+    return stories
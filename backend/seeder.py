@@ -1,6 +1,11 @@
 import os
 import re
-from database import SessionLocal, Story, Profile
+from sqlalchemy import insert
+from database import SessionLocal, Story, Profile, sync_profile_vector_indexes
+from embeddings import embed_text, embed_texts, embeddings_available, EMBEDDING_BATCH_SIZE, EMBEDDING_CONCURRENCY
+from local_embeddings import local_embedding
+from chunks import backfill_chunks
+from prompt_context import summarize
 from openai import OpenAI
 
 def get_openai_client():
@@ -47,29 +52,23 @@ def parse_test_stories():
 
 def generate_embedding(text, client):
     """Generate embedding for text"""
-    if client is None:
-        # Fallback: simple hash-based dummy embedding
-        import hashlib
-        import random
-        
-        # Use text hash as seed for consistent embeddings
-        hash_seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
-        random.seed(hash_seed)
-        return [random.random() for _ in range(1536)]
+    if not embeddings_available(client):
+        # Fallback: the same local embedding the API uses, so queries still match
+        return local_embedding(text)
     
     try:
-        response = client.embeddings.create(
-            model="text-embedding-ada-002",
-            input=text
-        )
-        return response.data[0].embedding
+        return embed_text(text, client)
     except Exception as e:
         print(f"Embedding generation failed: {e}")
-        # Fallback to dummy embedding
-        import random
-        return [random.random() for _ in range(1536)]
+        return local_embedding(text)
+
+def generate_embeddings(texts, client, batch_size=EMBEDDING_BATCH_SIZE, concurrency=EMBEDDING_CONCURRENCY):
+    """Generate embeddings for many texts using batched, parallel requests"""
+    embeddings = embed_texts(texts, client, batch_size=batch_size, concurrency=concurrency)
+    # Anything that could not be embedded gets the local hashing embedding
+    return [e if e is not None else generate_embedding(t, None) for t, e in zip(texts, embeddings)]
 
-def seed_database():
+def seed_database(batch_size=EMBEDDING_BATCH_SIZE, concurrency=EMBEDDING_CONCURRENCY):
     """Seed database with test stories"""
     db = SessionLocal()
     client = get_openai_client()
@@ -104,22 +103,28 @@ def seed_database():
         stories = parse_test_stories()
         print(f"Seeding database with {len(stories)} stories for {steve_jobs_profile.name}...")
         
-        for story_data in stories:
-            embedding = generate_embedding(story_data["transcript"], client)
-            
-            story = Story(
-                profile_id=steve_jobs_profile.id,
-                transcript=story_data["transcript"],
-                embedding=embedding,
-                event_year=story_data["year"],
-                audio_path=None
-            )
-            
-            db.add(story)
+        embeddings = generate_embeddings(
+            [story_data["transcript"] for story_data in stories], client,
+            batch_size=batch_size, concurrency=concurrency
+        )
+        story_rows = []
+        for story_data, embedding in zip(stories, embeddings):
+            story_rows.append({
+                "profile_id": steve_jobs_profile.id,
+                "transcript": story_data["transcript"],
+                "summary": summarize(story_data["transcript"]),
+                "embedding": embedding,
+                "event_year": story_data["year"],
+                "audio_path": None
+            })
             print(f"Added story from {story_data['year']}: {story_data['title']}")
+        if story_rows:
+            db.execute(insert(Story), story_rows)
         
         db.commit()
         print("Database seeding completed successfully!")
+        sync_profile_vector_indexes()
+        backfill_chunks(client, batch_size=batch_size, concurrency=concurrency)
         
     except Exception as e:
         print(f"Error seeding database: {e}")
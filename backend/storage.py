@@ -0,0 +1,275 @@
+"""
+Content-addressed audio storage.
+
+Uploads are streamed to disk in bounded chunks and hashed on the way, so
+memory stays flat regardless of file size. Files live at
+ab/cd/<sha256>.<ext> under STORAGE_DIR, so the same recording is stored
+once however often it is uploaded or loaded. Stories and chunks refer to
+files by that relative path; a file nothing refers to any more is removed by
+`collect_garbage` (`python cli.py gc-audio`).
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+import uuid
+from collections import Counter
+from fastapi import HTTPException
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import text
+
+STORAGE_DIR = "/app/storage"
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(500 * 1024 * 1024)))
+# Unreferenced files younger than this may belong to an upload whose story is not committed yet
+AUDIO_GC_GRACE_SECONDS = int(os.getenv("AUDIO_GC_GRACE_SECONDS", "3600"))
+# Remembers which source files the loader already stored, keyed by path, size and mtime
+IMPORT_MANIFEST = ".import-manifest.json"
+CONTENT_NAME = re.compile(r"[0-9a-f]{64}[.\w]*$")
+
+def file_extension(filename):
+    extension = filename.rsplit(".", 1)[-1].lower() if filename and "." in filename else "bin"
+    # Only keep simple extensions; anything else could escape the storage directory
+    return extension if extension.isalnum() and len(extension) <= 8 else "bin"
+
+def content_path(sha256, extension):
+    """Relative storage path of a file with this digest"""
+    return f"{sha256[:2]}/{sha256[2:4]}/{sha256}.{extension}"
+
+def is_content_addressed(relative_path):
+    """Named by digest (or derived from such a file), so its bytes never change"""
+    return bool(CONTENT_NAME.match(os.path.basename(relative_path)))
+
+def storage_path(relative_path):
+    """Absolute path of a stored file, or None if the path would leave STORAGE_DIR"""
+    root = os.path.realpath(STORAGE_DIR)
+    path = os.path.realpath(os.path.join(root, relative_path))
+    if os.path.commonpath([root, path]) != root or path == root:
+        return None
+    return path
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _write_chunk(f, chunk):
+    f.write(chunk)
+
+def _discard(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+def claim_existing(path):
+    """True if the file is already stored. Its mtime is refreshed so release_file and
+    collect_garbage leave it alone while the caller's story is not committed yet."""
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+def _finalize(temp_path, final_path):
+    """Move the temp file into place; returns True if an identical file was already stored"""
+    if claim_existing(final_path):
+        os.remove(temp_path)
+        return True
+    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+    os.replace(temp_path, final_path)
+    return False
+
+async def save_upload(upload, max_bytes=MAX_UPLOAD_BYTES):
+    """Stream an UploadFile to content-addressed storage.
+
+    Returns (relative path, sha256, size, duplicate). Raises 413 once more than
+    max_bytes have been read, without keeping the partial file.
+    """
+    os.makedirs(STORAGE_DIR, exist_ok=True)
+    temp_path = os.path.join(STORAGE_DIR, f".upload-{uuid.uuid4().hex}.part")
+    digest = hashlib.sha256()
+    size = 0
+
+    f = await run_in_threadpool(open, temp_path, "wb")
+    try:
+        while True:
+            chunk = await upload.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            size += len(chunk)
+            if size > max_bytes:
+                raise HTTPException(status_code=413, detail=f"Upload exceeds {max_bytes} bytes")
+            digest.update(chunk)
+            await run_in_threadpool(_write_chunk, f, chunk)
+    except BaseException:
+        await run_in_threadpool(f.close)
+        await run_in_threadpool(_discard, temp_path)
+        raise
+    await run_in_threadpool(f.close)
+
+    sha256 = digest.hexdigest()
+    relative_path = content_path(sha256, file_extension(upload.filename))
+    duplicate = await run_in_threadpool(_finalize, temp_path, os.path.join(STORAGE_DIR, relative_path))
+    return relative_path, sha256, size, duplicate
+
+def store_file(source_path):
+    """Copy a local file into content-addressed storage unless it is already there.
+
+    Returns (relative path, copied).
+    """
+    relative_path = content_path(file_sha256(source_path), file_extension(source_path))
+    target_path = os.path.join(STORAGE_DIR, relative_path)
+    if claim_existing(target_path):
+        return relative_path, False
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    temp_path = os.path.join(STORAGE_DIR, f".upload-{uuid.uuid4().hex}.part")
+    shutil.copyfile(source_path, temp_path)
+    _finalize(temp_path, target_path)
+    return relative_path, True
+
+def adopt_file(temp_path, extension):
+    """Move a file written inside STORAGE_DIR (e.g. a transcode) to its content path.
+
+    Returns (relative path, sha256).
+    """
+    sha256 = file_sha256(temp_path)
+    relative_path = content_path(sha256, extension)
+    _finalize(temp_path, os.path.join(STORAGE_DIR, relative_path))
+    return relative_path, sha256
+
+def temp_file(extension):
+    """A scratch path inside STORAGE_DIR, so adopt_file is a rename on the same filesystem"""
+    os.makedirs(STORAGE_DIR, exist_ok=True)
+    return os.path.join(STORAGE_DIR, f".upload-{uuid.uuid4().hex}.{extension}")
+
+def import_files(source_paths):
+    """store_file for a directory import, skipping sources unchanged since the last run.
+
+    Returns {source path: (relative path, copied)}.
+    """
+    manifest_path = os.path.join(STORAGE_DIR, IMPORT_MANIFEST)
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    results = {}
+    for source_path in source_paths:
+        stat = os.stat(source_path)
+        key = os.path.abspath(source_path)
+        known = manifest.get(key)
+        if (known and known["size"] == stat.st_size and known["mtime_ns"] == stat.st_mtime_ns
+                and claim_existing(os.path.join(STORAGE_DIR, known["path"]))):
+            results[source_path] = (known["path"], False)
+            continue
+        relative_path, copied = store_file(source_path)
+        manifest[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "path": relative_path}
+        results[source_path] = (relative_path, copied)
+
+    os.makedirs(STORAGE_DIR, exist_ok=True)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=1)
+    return results
+
+def audio_references(db):
+    """Reference count per stored file: stories (served or kept original) plus chunks (audio segments)"""
+    rows = db.execute(text("""
+        SELECT audio_path, COUNT(*) FROM (
+            SELECT audio_path FROM stories WHERE audio_path IS NOT NULL
+            UNION ALL
+            SELECT original_audio_path FROM stories WHERE original_audio_path IS NOT NULL
+            UNION ALL
+            SELECT audio_path FROM story_chunks WHERE audio_path IS NOT NULL
+        ) refs
+        GROUP BY audio_path
+    """))
+    return Counter({path: count for path, count in rows})
+
+def reference_count(db, relative_path):
+    """audio_references for a single file, through the audio_path indexes"""
+    return db.execute(text("""
+        SELECT (SELECT COUNT(*) FROM stories WHERE audio_path = :path)
+             + (SELECT COUNT(*) FROM stories WHERE original_audio_path = :path)
+             + (SELECT COUNT(*) FROM story_chunks WHERE audio_path = :path)
+    """), {"path": relative_path}).scalar()
+
+def release_file(db, relative_path, grace_seconds=AUDIO_GC_GRACE_SECONDS):
+    """Delete a stored file once nothing refers to it; call after committing the change that dropped the reference.
+
+    Like collect_garbage, a file stored or re-claimed within grace_seconds is
+    kept: a concurrent upload of the same digest may point at it from a story
+    that is not committed yet. `python cli.py gc-audio` removes it later.
+    """
+    path = storage_path(relative_path)
+    if not path or reference_count(db, relative_path):
+        return False
+    try:
+        if os.stat(path).st_mtime > time.time() - grace_seconds:
+            return False
+        os.remove(path)
+    except FileNotFoundError:
+        return False
+    return True
+
+def collect_garbage(db, dry_run=False, grace_seconds=AUDIO_GC_GRACE_SECONDS):
+    """Delete stored files with no references; returns (files, bytes) removed"""
+    references = audio_references(db)
+    cutoff = time.time() - grace_seconds
+    removed, freed = 0, 0
+    for directory, _, filenames in os.walk(STORAGE_DIR):
+        for filename in filenames:
+            if filename.startswith("."):
+                continue
+            path = os.path.join(directory, filename)
+            relative_path = os.path.relpath(path, STORAGE_DIR)
+            stat = os.stat(path)
+            if references[relative_path] or stat.st_mtime > cutoff:
+                continue
+            if not dry_run:
+                os.remove(path)
+            removed += 1
+            freed += stat.st_size
+    return removed, freed
+
+RANGE_PATTERN = re.compile(r"bytes=(\d*)-(\d*)$")
+
+def parse_range(header, size):
+    """(start, end) inclusive byte range for a Range header, or None for the whole file.
+
+    Only single ranges are supported; anything else is served in full.
+    Raises 416 for a range that lies outside the file.
+    """
+    match = RANGE_PATTERN.match(header.strip()) if header else None
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        if last and int(last) < start:
+            # Syntactically invalid (RFC 7233 §2.1): ignore the header
+            return None
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise HTTPException(
+            status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, end
+
+def iter_file(path, start, end, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Yield bytes start..end (inclusive) of a file in bounded chunks"""
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
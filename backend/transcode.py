@@ -0,0 +1,64 @@
+"""
+Ingest-time audio transcoding and waveform peaks.
+
+With TRANSCODE_ON_INGEST the worker re-encodes each uploaded recording to a
+low-bitrate mono speech format (Opus in Ogg, or AAC in M4A) and stores it
+content-addressed; the story then points at the compact file. Peak data
+for the player's waveform is computed from the same decode. The original is
+kept (as `original_audio_path`) only with TRANSCODE_KEEP_ORIGINAL.
+"""
+import os
+import numpy as np
+
+from audio_segments import load_audio
+from storage import adopt_file, temp_file
+
+TRANSCODE_ON_INGEST = os.getenv("TRANSCODE_ON_INGEST", "false").lower() == "true"
+TRANSCODE_FORMAT = os.getenv("TRANSCODE_FORMAT", "opus").lower()
+TRANSCODE_BITRATE = os.getenv("TRANSCODE_BITRATE", "32k")
+TRANSCODE_KEEP_ORIGINAL = os.getenv("TRANSCODE_KEEP_ORIGINAL", "false").lower() == "true"
+WAVEFORM_PEAKS = int(os.getenv("WAVEFORM_PEAKS", "800"))
+
+# format -> (extension, ffmpeg muxer, codec, sample rate, extra encoder options)
+FORMATS = {
+    # .ogg rather than .opus: Whisper and older browsers accept it
+    "opus": ("ogg", "ogg", "libopus", 24000, ["-application", "voip"]),
+    "aac": ("m4a", "ipod", "aac", 22050, []),
+}
+if TRANSCODE_FORMAT not in FORMATS:
+    raise ValueError(f"Unknown TRANSCODE_FORMAT: {TRANSCODE_FORMAT}")
+
+def waveform_peaks(audio, buckets=WAVEFORM_PEAKS):
+    """Peak amplitude per bucket, scaled to 0..1, for drawing the player waveform"""
+    samples = np.abs(np.array(audio.set_channels(1).get_array_of_samples(), dtype=np.float32))
+    if not len(samples):
+        return []
+    full_scale = float(1 << (8 * audio.sample_width - 1))
+    buckets = min(buckets, len(samples))
+    peaks = [chunk.max() / full_scale for chunk in np.array_split(samples, buckets)]
+    return [round(min(float(p), 1.0), 3) for p in peaks]
+
+def transcode(source_path, format=TRANSCODE_FORMAT, bitrate=TRANSCODE_BITRATE):
+    """Encode a recording for speech playback and store it.
+
+    Returns (relative path or None, duration_ms, peaks). The path is None when
+    the encode would not be smaller than the source, so the source is kept.
+    """
+    extension, muxer, codec, sample_rate, parameters = FORMATS[format]
+    audio = load_audio(source_path)
+    peaks = waveform_peaks(audio)
+
+    output_path = temp_file(extension)
+    try:
+        audio.set_channels(1).set_frame_rate(sample_rate).export(
+            output_path, format=muxer, codec=codec, bitrate=bitrate, parameters=parameters
+        )
+        if os.path.getsize(output_path) >= os.path.getsize(source_path):
+            os.remove(output_path)
+            return None, len(audio), peaks
+        relative_path, _ = adopt_file(output_path, extension)
+    except BaseException:
+        if os.path.exists(output_path):
+            os.remove(output_path)
+        raise
+    return relative_path, len(audio), peaks
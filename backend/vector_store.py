@@ -0,0 +1,218 @@
+"""
+In-process vector search over memory-mapped per-profile embedding matrices.
+
+With VECTOR_BACKEND=memory, /chat ranks stories with NumPy instead of
+pgvector. Each profile's ready story vectors are snapshotted from Postgres
+into a versioned directory of .npy files (float32 or float16) under
+VECTOR_STORE_DIR, published by an atomic rename, memory-mapped and scored by brute-force dot product over unit-length rows, i.e. cosine
+similarity. Postgres stays the source of truth; a snapshot is only a cache.
+
+Freshness follows `profiles.timeline_version`, which the stories trigger
+bumps on every insert, delete or status change. A snapshot records the
+version it was read at; a search with a newer version rebuilds it (or maps
+one another process already wrote). POST /stories appends its vector in
+place when nothing else changed in between, so a new story is searchable
+without a rebuild.
+
+Only whole-story vectors are indexed: chunks are added by the worker without
+a version bump, so a snapshot could not tell when they change.
+"""
+import glob
+import os
+import re
+import shutil
+import threading
+import uuid
+import numpy as np
+
+from database import Story, Profile, EMBEDDING_DIM
+
+# "pgvector" (default): ANN search in Postgres; "memory": this module
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pgvector").lower()
+if VECTOR_BACKEND not in ("pgvector", "memory"):
+    raise ValueError(f"Unknown VECTOR_BACKEND: {VECTOR_BACKEND}")
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "/app/vector_store")
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32").lower()
+if VECTOR_STORE_DTYPE not in ("float32", "float16"):
+    raise ValueError(f"Unknown VECTOR_STORE_DTYPE: {VECTOR_STORE_DTYPE}")
+# Rows converted to float32 per matrix-vector product; bounds the temporary copy for float16
+SCORE_BLOCK_ROWS = 16384
+NO_YEAR = np.iinfo(np.int32).min
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+def snapshot_dir(profile_id, version):
+    return os.path.join(VECTOR_STORE_DIR, f"profile-{profile_id}-v{version}")
+
+def snapshot_versions(profile_id):
+    """{version: path} of the profile's published snapshots (temp directories are never matched)"""
+    pattern = re.compile(rf"profile-{int(profile_id)}-v(\d+)$")
+    versions = {}
+    for path in glob.glob(os.path.join(VECTOR_STORE_DIR, f"profile-{int(profile_id)}-v*")):
+        match = pattern.match(os.path.basename(path))
+        if match and os.path.isdir(path):
+            versions[int(match.group(1))] = path
+    return versions
+
+class ProfileVectors:
+    """A profile's story vectors at one timeline_version: a mapped snapshot plus
+    stories appended since. Never mutated; appending returns a new object, so
+    concurrent searches always see a consistent set."""
+
+    def __init__(self, version, matrix, story_ids, years, tail=None):
+        self.version = version
+        self.matrix = matrix
+        self.story_ids = story_ids
+        self.years = years
+        self.tail = tail if tail is not None else np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+
+    def __len__(self):
+        return len(self.story_ids)
+
+    def appended(self, version, story_id, embedding, event_year):
+        return ProfileVectors(
+            version,
+            self.matrix,
+            np.append(self.story_ids, story_id),
+            np.append(self.years, NO_YEAR if event_year is None else event_year).astype(np.int32),
+            np.vstack([self.tail, normalize(embedding)[None, :]]),
+        )
+
+    def scores(self, query):
+        parts = [
+            np.asarray(self.matrix[start:start + SCORE_BLOCK_ROWS], dtype=np.float32) @ query
+            for start in range(0, len(self.matrix), SCORE_BLOCK_ROWS)
+        ]
+        parts.append(self.tail @ query)
+        return np.concatenate(parts)
+
+    def search(self, query_embedding, limit, year_from=None, year_to=None):
+        """[(story_id, similarity)] best first"""
+        scores = self.scores(normalize(query_embedding))
+        if year_from is not None or year_to is not None:
+            mask = self.years != NO_YEAR
+            if year_from is not None:
+                mask &= self.years >= year_from
+            if year_to is not None:
+                mask &= self.years <= year_to
+            scores = np.where(mask, scores, -np.inf)
+        candidates = np.flatnonzero(np.isfinite(scores))
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [(int(self.story_ids[i]), float(scores[i])) for i in candidates]
+
+def write_snapshot(profile_id, version, story_ids, years, vectors):
+    """Publish the three arrays as one versioned directory and drop older versions.
+
+    The arrays are written to a private temp directory that is then renamed
+    into place, so readers only ever see a complete snapshot from a single
+    build. If another process already published this version, its copy wins
+    and ours is discarded. Newer versions are never touched.
+    """
+    os.makedirs(VECTOR_STORE_DIR, exist_ok=True)
+    final = snapshot_dir(profile_id, version)
+    temp = f"{final}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    os.makedirs(temp)
+    try:
+        for name, array in (("ids", story_ids), ("years", years), ("vectors", vectors)):
+            np.save(os.path.join(temp, f"{name}.npy"), array)
+        os.rename(temp, final)
+    except OSError:
+        # Lost the race to publish this version (rename onto a non-empty directory fails)
+        shutil.rmtree(temp, ignore_errors=True)
+        if not os.path.isdir(final):
+            raise
+    for old_version, path in snapshot_versions(profile_id).items():
+        if old_version < version:
+            # Processes that mapped the old files keep reading them until they reload
+            shutil.rmtree(path, ignore_errors=True)
+
+def read_snapshot(profile_id, version):
+    """The newest published snapshot at `version` or later, or None"""
+    for available in sorted((v for v in snapshot_versions(profile_id) if v >= version), reverse=True):
+        path = snapshot_dir(profile_id, available)
+        try:
+            matrix = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            return ProfileVectors(
+                available, matrix, np.load(os.path.join(path, "ids.npy")), np.load(os.path.join(path, "years.npy"))
+            )
+        except (FileNotFoundError, ValueError):
+            # Removed by a newer writer's cleanup, or not a snapshot this code wrote
+            continue
+    return None
+
+def build_snapshot(db, profile_id):
+    """Read a profile's ready story vectors from Postgres and write them as a snapshot"""
+    # Version first: a write landing in between makes the snapshot look older than
+    # it is (one extra rebuild), never newer
+    version = db.query(Profile.timeline_version).filter(Profile.id == profile_id).scalar()
+    if version is None:
+        return None
+    rows = db.query(Story.id, Story.event_year, Story.embedding).filter(
+        Story.profile_id == profile_id, Story.status == "ready", Story.embedding.isnot(None)
+    ).order_by(Story.id).all()
+    story_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    years = np.array([NO_YEAR if row[1] is None else row[1] for row in rows], dtype=np.int32)
+    vectors = normalize(np.array([row[2] for row in rows], dtype=np.float32).reshape(len(rows), EMBEDDING_DIM))
+    write_snapshot(profile_id, version, story_ids, years, vectors.astype(VECTOR_STORE_DTYPE))
+    return read_snapshot(profile_id, version)
+
+class VectorStore:
+    def __init__(self):
+        self._profiles = {}
+        self._lock = threading.Lock()
+        self.rebuilds = 0
+        self.appends = 0
+
+    def get(self, db, profile_id, version):
+        """The profile's vectors at `version` (its current timeline_version), loading or rebuilding if stale"""
+        vectors = self._profiles.get(profile_id)
+        if vectors is not None and vectors.version >= version:
+            return vectors
+        with self._lock:
+            vectors = self._profiles.get(profile_id)
+            if vectors is not None and vectors.version >= version:
+                return vectors
+            vectors = read_snapshot(profile_id, version)
+            if vectors is None:
+                vectors = build_snapshot(db, profile_id)
+                self.rebuilds += 1
+            if vectors is not None:
+                self._profiles[profile_id] = vectors
+            return vectors
+
+    def add(self, profile_id, version, story_id, embedding, event_year):
+        """Record a story just inserted at `version`; skipped (rebuilt on the next
+        search) unless the loaded vectors are exactly one version behind"""
+        with self._lock:
+            vectors = self._profiles.get(profile_id)
+            if vectors is None or vectors.version != version - 1:
+                return
+            self._profiles[profile_id] = vectors.appended(version, story_id, embedding, event_year)
+            self.appends += 1
+
+    def rebuild_all(self, db):
+        profile_ids = [row[0] for row in db.query(Profile.id).order_by(Profile.id)]
+        total = 0
+        for profile_id in profile_ids:
+            vectors = build_snapshot(db, profile_id)
+            db.rollback()
+            total += len(vectors) if vectors is not None else 0
+        return len(profile_ids), total
+
+    def stats(self):
+        with self._lock:
+            profiles = list(self._profiles.values())
+            return {
+                "profiles": len(profiles),
+                "vectors": sum(len(v) for v in profiles),
+                "appended": sum(len(v.tail) for v in profiles),
+                "rebuilds": self.rebuilds,
+                "appends": self.appends,
+            }
+
+vector_store = VectorStore()
@@ -64,8 +64,17 @@ export default function Stories() {
   const fetchStories = async (profileId: number) => {
     setStoriesLoading(true)
     try {
-      const response = await axios.get(`${API_URL}/profiles/${profileId}/stories`)
-      setStories(response.data)
+      // Follow the keyset cursor until the whole timeline is loaded
+      const allStories: Story[] = []
+      let after: string | undefined
+      do {
+        const response = await axios.get(`${API_URL}/profiles/${profileId}/stories`, {
+          params: { limit: 100, after }
+        })
+        allStories.push(...response.data)
+        after = response.headers['x-next-cursor']
+      } while (after)
+      setStories(allStories)
     } catch (error) {
       console.error('Failed to fetch stories:', error)
     } finally {
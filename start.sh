@@ -26,7 +26,11 @@ echo "Database setup completed."
 # Ensure storage directory exists
 mkdir -p /app/storage
 
-# Start applications
-cd /app/backend && python -m uvicorn main:app --host 0.0.0.0 --port 8000 &
+# Create/upgrade the schema once, before any API worker starts
+cd /app/backend && python cli.py migrate || exit 1
+
+# Start applications (API workers: WEB_CONCURRENCY, else one per CPU)
+cd /app/backend && python cli.py serve --port 8000 &
+cd /app/backend && python cli.py worker &
 cd /app/frontend && node .next/standalone/server.js &
 wait
\ No newline at end of file